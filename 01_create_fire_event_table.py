@@ -38,9 +38,10 @@ from shapely.geometry import Point
 from pyhdf.SD import SD, SDC
 from pyhdf.error import HDF4Error
 
+from firetracks import storage
+
 # parameters
 min_year = 2002
-max_year = 2020
 
 # argument parameters
 parser = argparse.ArgumentParser(
@@ -53,6 +54,26 @@ parser.add_argument(
     type=int,
     default=mp.cpu_count(),
 )
+parser.add_argument(
+    '--storage',
+    help="storage backend of the fire event table (v.h5, v.parquet or "
+         "v.zarr), see firetracks/storage.py",
+    choices=list(storage.backends),
+    default='hdf',
+)
+parser.add_argument(
+    '-a', '--append',
+    help="only process the years after the last year of the stored fire "
+         "event table, and append their fire events to it (label them with "
+         "04_find_connected_fire_events.py --append)",
+    action='store_true',
+)
+parser.add_argument(
+    '--max-year',
+    help="last year to process, by default the last year of the available "
+         "MOD14A1/MYD14A1 granules",
+    type=int,
+)
 args = parser.parse_args()
 
 # file sytem
@@ -109,11 +130,6 @@ r = R_e + h
 Hs = np.arange(0, 36)
 Vs = np.arange(0, 18)
 
-# datetime <-> integer dictionary
-dates = pd.date_range(
-    str(min_year) + '-01-01', str(max_year + 1) + '-01-01', freq='D')
-dtdic = {date: i for i, date in enumerate(dates)}
-
 # neighbour dict
 ndict = {
     0: 'not processed',
@@ -151,6 +167,18 @@ myd_files.sort()
 myd_files_dict = {meta_from_file(fname): fname for fname in myd_files if
                   fname.endswith('.hdf')}
 
+# last year to process
+if args.max_year is not None:
+    max_year = args.max_year
+else:
+    max_year = max([int(key[1]) for key in mod_files_dict] +
+                   [int(key[1]) for key in myd_files_dict] + [min_year])
+
+# datetime <-> integer dictionary
+dates = pd.date_range(
+    str(min_year) + '-01-01', str(max_year + 1) + '-01-01', freq='D')
+dtdic = {date: i for i, date in enumerate(dates)}
+
 
 class ProcessYearFday(object):
 
@@ -770,6 +798,17 @@ if __name__ == '__main__':
 
     years = np.arange(min_year, max_year + 1)
 
+    if args.append:
+        # years after the last stored fire event
+        v_file = storage.table_file(cwd, 'v')
+        n_stored = storage.nrows(v_file)
+        last = storage.read_table(v_file, columns=['dtime'],
+                                  start=n_stored - 1)['dtime'].iloc[0]
+        years = years[years > last.year]
+        if len(years) == 0:
+            print('no years after {} to append'.format(last.year))
+            raise SystemExit
+
     vs, metas = zip(*Pool(processes=args.processes).map(main, years))
 
     # concat meta data
@@ -782,6 +821,10 @@ if __name__ == '__main__':
     meta.columns = ['year', 'fday', 'satellite', 'H', 'V', 'meta']
 
     # store meta dataframe
+    if args.append:
+        meta = pd.concat((pd.read_pickle(
+            os.path.join(cwd, 'mxd14a1_meta.pickle')), meta),
+            ignore_index=True)
     meta.to_pickle(os.path.join(cwd, 'mxd14a1_meta.pickle'))
     print('stored {}'.format(os.path.join(cwd, 'mxd14a1_meta.pickle')))
 
@@ -796,7 +839,19 @@ if __name__ == '__main__':
     v.loc[:, 'neigh'] = v['neigh'].apply(lambda x: ndict[x])
 
     # create geographical location labels
-    v.loc[:, 'gl'] = v.groupby(['x', 'y']).grouper.group_info[0]
+    if args.append:
+        # labels of stored locations, new locations continue the labels
+        locs = storage.read_table(v_file, columns=['x', 'y', 'gl'])
+        locs = locs.drop_duplicates(['x', 'y'])
+        gl = v[['x', 'y']].astype(locs[['x', 'y']].dtypes).merge(
+            locs, how='left', on=['x', 'y'])['gl'].to_numpy(
+                dtype=np.float64, copy=True)
+        new = np.isnan(gl)
+        gl[new] = locs['gl'].max() + 1 + \
+            v.loc[new].groupby(['x', 'y']).ngroup().values
+        v.loc[:, 'gl'] = gl
+    else:
+        v.loc[:, 'gl'] = v.groupby(['x', 'y']).grouper.group_info[0]
 
     # get rid of needless columns
     del v['day']
@@ -813,9 +868,12 @@ if __name__ == '__main__':
         'gl': np.uint32,
     })
 
-    # store as hdf
-    store = pd.HDFStore(os.path.join(cwd, 'v.h5'), mode='w')
-    store.append('v', v, format='t', data_columns=True, index=False)
-    store.create_table_index('v', columns=['t', 'dtime'], kind='full')
-    store.close()
-    print('stored {}'.format(os.path.join(cwd, 'v.h5')))
+    # store
+    index_columns = ['t', 'dtime', 'lat', 'lon', 'H', 'V', 'conf']
+    if args.append:
+        storage.append_table(v_file, v, index_columns)
+        print('appended {} fire events to {}'.format(len(v), v_file))
+    else:
+        v_file = storage.table_file(cwd, 'v', args.storage)
+        storage.write_table(v_file, v, index_columns=index_columns)
+        print('stored {}'.format(v_file))
@@ -15,6 +15,8 @@ import pandas as pd
 from pyhdf.SD import SD, SDC
 from pyhdf.error import HDF4Error
 
+from firetracks import shm, storage
+
 # argument parameters
 parser = argparse.ArgumentParser(
     description=__doc__,
@@ -53,7 +55,20 @@ cwd = os.getcwd()
 mcd_data = os.path.join(cwd, 'MCD12Q1')
 
 # load fire event table
-v = pd.read_hdf(os.path.join(cwd, 'v.h5'), 'v', columns=['dtime', 'x', 'y'])
+v = storage.read_table(storage.table_file(cwd, 'v'),
+                       columns=['dtime', 'x', 'y'])
+
+# which years to process
+year = v['dtime'].dt.year.values
+min_year = year.min()
+max_year = year.max() + 1
+years = np.arange(min_year, max_year)
+
+# sort fire events by year, row ranges of each year
+order = np.argsort(year, kind='stable')
+columns = {col: v[col].values[order] for col in ['dtime', 'x', 'y']}
+bounds = shm.row_ranges(year[order], np.append(years, max_year))
+del v, year, order
 
 
 # to extract metadata from file
@@ -135,22 +150,13 @@ class CreateLCM(object):
         return mcd_file
 
 
-def process_land_cover(vt, lcm):
-
-    # land cover and flags
-    lc1234 = np.zeros((len(vt), 4), dtype=np.uint8)
-
-    # process land cover for each fire
-    c = 0
-    for y, x in zip(vt['y'], vt['x']):
+def process_land_cover(x, y, lcm):
 
-        # land cover box
-        box = lcm[2*y:2*y+2, 2*x:2*x+2]
-
-        # store original land covers
-        lc1234[c] = box.flatten().tolist()
-
-        c += 1
+    # land cover box of each fire (2x2 land cover pixels, row-major)
+    x = 2 * x.astype(np.int64)
+    y = 2 * y.astype(np.int64)
+    lc1234 = np.stack((lcm[y, x], lcm[y, x+1], lcm[y+1, x], lcm[y+1, x+1]),
+                      axis=1)
 
     vt_lc = pd.DataFrame(lc1234)
     vt_lc.columns = ['lc1', 'lc2', 'lc3', 'lc4']
@@ -167,25 +173,25 @@ def main(year):
     # store meta dataframe
     meta = pd.DataFrame(data=p.lcm_meta)
 
-    # find land covers for each fire event
-    vt = v.loc[v['dtime'].dt.year == year]
-    vt_lc = process_land_cover(vt, lcm)
+    # find land covers for each fire event (shared arrays, see shm.attach)
+    rows = slice(bounds[year - min_year], bounds[year - min_year + 1])
+    vt_lc = process_land_cover(
+        shm.arrays['x'][rows], shm.arrays['y'][rows], lcm)
 
     # add dtime
-    vt_lc['dtime'] = vt['dtime'].values
+    vt_lc['dtime'] = shm.arrays['dtime'][rows]
 
     return vt_lc, meta
 
 
 if __name__ == '__main__':
 
-    # which years to process
-    min_year = v['dtime'].dt.year.min()
-    max_year = v['dtime'].dt.year.max() + 1
-    years = np.arange(min_year, max_year)
-
-    # process land cover types
-    vt_lcs, metas = zip(*Pool(args.processes).map(main, years))
+    # publish fire events to the workers, process land cover types
+    with shm.published(columns) as spec:
+        del columns
+        with Pool(args.processes, initializer=shm.attach,
+                  initargs=(spec,)) as pool:
+            vt_lcs, metas = zip(*pool.map(main, years))
 
     # concat meta data
     meta = pd.concat(metas)
@@ -196,9 +202,11 @@ if __name__ == '__main__':
     # set column names of meta data
     meta.columns = ['year', 'H', 'V', 'meta']
 
-    # store meta dataframe
-    meta.to_pickle(os.path.join(cwd, 'mcd12q1_meta.pickle'))
-    print('stored {}'.format(os.path.join(cwd, 'mcd12q1_meta.pickle')))
+    # store meta dataframe (per land cover type, several types may be
+    # processed concurrently)
+    meta_file = os.path.join(cwd, 'mcd12q1_meta_{}.pickle'.format(lc_type))
+    meta.to_pickle(meta_file)
+    print('stored {}'.format(meta_file))
 
     # concat land cover dataframes
     v_lc = pd.concat(vt_lcs, axis=0, sort=False)
@@ -208,10 +216,5 @@ if __name__ == '__main__':
 
     # store dataframe as hdf
     v_lc_file = os.path.join(cwd, 'v_{}.h5'.format(lc_type))
-    store = pd.HDFStore(v_lc_file, mode='w')
-    store.append('v_{}'.format(lc_type), v_lc, format='t', data_columns=True,
-                 index=False)
-    store.create_table_index('v_{}'.format(lc_type), columns=['dtime'],
-                             kind='full')
-    store.close()
+    storage.write_table(v_lc_file, v_lc, index_columns=['dtime'])
     print('stored {}'.format(v_lc_file))
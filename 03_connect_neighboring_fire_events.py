@@ -13,6 +13,8 @@ import numpy as np
 import pandas as pd
 import deepgraph as dg
 
+from firetracks import storage
+
 # argument parameters
 parser = argparse.ArgumentParser(
     description=__doc__,
@@ -24,6 +26,29 @@ parser.add_argument(
     type=int,
     default=mp.cpu_count(),
 )
+parser.add_argument(
+    '-s', '--shards',
+    help="store the edges of each chunk as a separate file in e/ instead of "
+         "concatenating them into e.pickle (for out-of-core component "
+         "labelling, see 04_find_connected_fire_events.py --memory)",
+    action='store_true',
+)
+parser.add_argument(
+    '-r', '--max-radius',
+    help="connect fire events up to this distance in grid cells (in x and "
+         "y). Use a larger value to compute a superset of edges for "
+         "04_find_connected_fire_events.py --radii",
+    type=int,
+    default=1,
+)
+parser.add_argument(
+    '-g', '--max-gap',
+    help="connect fire events up to this number of days apart. Use a larger "
+         "value to compute a superset of edges for "
+         "04_find_connected_fire_events.py --gaps",
+    type=int,
+    default=1,
+)
 args = parser.parse_args()
 
 # computation parameters
@@ -34,6 +59,8 @@ n_proc = 200
 # file system
 cwd = os.getcwd()
 os.makedirs(os.path.join(cwd, 'logs'), exist_ok=True)
+if args.shards:
+    os.makedirs(os.path.join(cwd, 'e'), exist_ok=True)
 
 
 def grid_2d_dx(x_s, x_t):
@@ -57,27 +84,27 @@ def grid_2d_dy(y_s, y_t):
 
 
 def grid_2d_octogonal_dx(dx, sources, targets):
-    """Select first neighbours on 2d-grid, including diagonals."""
+    """Select neighbours up to max_radius on 2d-grid, including diagonals."""
     dx_a = np.abs(dx)
 
-    sources = sources[dx_a <= 1]
-    targets = targets[dx_a <= 1]
+    sources = sources[dx_a <= args.max_radius]
+    targets = targets[dx_a <= args.max_radius]
 
     return sources, targets
 
 
 def grid_2d_octogonal_dy(dy, sources, targets):
-    """Select first neighbours on 2d-grid, including diagonals."""
+    """Select neighbours up to max_radius on 2d-grid, including diagonals."""
     dy_a = np.abs(dy)
 
-    sources = sources[dy_a <= 1]
-    targets = targets[dy_a <= 1]
+    sources = sources[dy_a <= args.max_radius]
+    targets = targets[dy_a <= args.max_radius]
 
     return sources, targets
 
 
 # use time as the fast track feature
-ft_feature = ('t', 1)
+ft_feature = ('t', args.max_gap)
 
 # define relations to select from
 connectors = [grid_2d_dx, grid_2d_dy]
@@ -87,16 +114,23 @@ selectors = [grid_2d_octogonal_dx, grid_2d_octogonal_dy, 'ft_selector']
 
 # force dtypes
 r_dtype_dic = {
-    'ft_r': np.bool,
+    'ft_r': np.uint8,
     'dx': np.int8,
     'dy': np.int8,
 }
 
+# fire event table; deepgraph reads an HDFStore partition-wise, tables of
+# other storage backends (or kept in memory) are loaded once (only the
+# columns needed)
+v_file = storage.table_file(cwd, 'v')
+hdf = (storage.backend_of(v_file) == 'hdf' and
+       storage.recall(os.path.abspath(v_file)) is None)
+if not hdf:
+    v_df = storage.read_table(v_file, columns=['t', 'x', 'y'])
+
 # index array
-store = pd.HDFStore(os.path.join(cwd, 'v.h5'), mode='r')
-n = store.get_storer('v').nrows
+n = storage.nrows(v_file)
 pos_array = np.array(np.linspace(0, n, n_proc), dtype=int)
-store.close()
 
 
 # parallel computation
@@ -107,7 +141,10 @@ def create_ei(i):
     from_pos = pos_array[i]
     to_pos = pos_array[i+1]
 
-    v = pd.HDFStore(os.path.join(cwd, 'v.h5'), mode='r')
+    if hdf:
+        v = pd.HDFStore(v_file, mode='r')
+    else:
+        v = v_df
 
     logfile = os.path.join(
         cwd, 'logs', '{:04d}_hdf_mcs{}_mp{}_n_proc{}.txt'.format(
@@ -125,11 +162,20 @@ def create_ei(i):
         from_pos=from_pos, to_pos=to_pos,
         verbose=False, logfile=logfile,
     )
-    v.close()
+    if hdf:
+        v.close()
 
     # rename fast track weights
     g.e.rename(columns={'ft_r': 'dt'}, inplace=True)
 
+    # connectivity the edges were computed for
+    g.e.attrs = {'max_radius': args.max_radius, 'max_gap': args.max_gap}
+
+    # store shard
+    if args.shards:
+        g.e.to_pickle(os.path.join(cwd, 'e', '{:04d}.pickle'.format(i)))
+        return len(g.e)
+
     return g.e
 
 
@@ -140,10 +186,16 @@ if __name__ == '__main__':
     # compute edges
     eis = Pool(args.processes).map(create_ei, indices)
 
-    # concat
-    e = pd.concat(eis)
+    if args.shards:
+        print('stored {} edges in {}'.format(
+            sum(eis), os.path.join(cwd, 'e')))
+
+    else:
+        # concat
+        e = pd.concat(eis)
+        e.attrs = {'max_radius': args.max_radius, 'max_gap': args.max_gap}
 
-    # store dataframe
-    e_file = os.path.join(cwd, 'e.pickle')
-    e.to_pickle(e_file)
-    print('stored {}'.format(e_file))
+        # store dataframe
+        e_file = os.path.join(cwd, 'e.pickle')
+        storage.write_pickle(e_file, e)
+        print('stored {}'.format(e_file))
@@ -5,40 +5,192 @@
 # MIT license.
 
 import os
+import glob
+import argparse
 
+import numpy as np
 import pandas as pd
 import deepgraph as dg
 
+from firetracks import components, sidecar, storage
+
+# argument parameters
+parser = argparse.ArgumentParser(
+    description=__doc__,
+    formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+)
+parser.add_argument(
+    '-a', '--append',
+    help="only label fire events appended to v.h5 since the last run, "
+         "connecting them to the stored frontier of the last day(s) "
+         "(see {})".format(components.state_file),
+    action='store_true',
+)
+parser.add_argument(
+    '-m', '--memory',
+    help="memory budget [GB]. If given, components are labelled out-of-core "
+         "from the edge shards in e/ (see 03_connect_neighboring_fire_events"
+         ".py --shards), using a disk-backed union-find. Otherwise, all "
+         "edges are loaded into memory",
+    type=float,
+)
+parser.add_argument(
+    '-r', '--radii',
+    nargs='+',
+    help="parameter sweep: additionally label components for each "
+         "combination of these radii and --gaps (other than the default "
+         "radius 1 and gap 1, stored as 'cp'), stored as 'cp_<r>_<dt>' "
+         "columns. The edges must have been computed for the largest "
+         "values (see 03_connect_neighboring_fire_events.py --max-radius). "
+         "Not supported with --append",
+    type=int,
+    default=[],
+)
+parser.add_argument(
+    '-g', '--gaps',
+    nargs='+',
+    help="parameter sweep: gaps in days (see --radii and "
+         "03_connect_neighboring_fire_events.py --max-gap)",
+    type=int,
+    default=[],
+)
+args = parser.parse_args()
+if args.append and (args.radii or args.gaps):
+    parser.error("--radii/--gaps are not supported with --append")
+
+# connectivity parameters (see 03_connect_neighboring_fire_events.py)
+radius = 1
+gap = 1
+
 # file system
 cwd = os.getcwd()
+v_file = storage.table_file(cwd, 'v')
+
+
+def select(e, r, dt):
+    """Subset of edges within r grid cells and dt days."""
+    max_radius = e.attrs.get('max_radius', 1)
+    max_gap = e.attrs.get('max_gap', 1)
+    if max_radius < r or max_gap < dt:
+        raise ValueError(
+            'edges were computed for max. radius {} and max. gap {}, not a '
+            'superset for radius {} and gap {}'.format(
+                max_radius, max_gap, r, dt))
+
+    return e.loc[(e['dx'].abs() <= r) & (e['dy'].abs() <= r) &
+                 (e['dt'] <= dt)]
+
+
+if args.append:
+
+    # load component state and appended fire events
+    state = components.read_state(cwd)
+    if sidecar.nrows(v_file, 'cp') != state['n']:
+        raise ValueError('cp column of {} does not match the stored '
+                         'component state'.format(v_file))
+    vn = storage.read_table(v_file, columns=['x', 'y', 't'],
+                            start=state['n'])
+
+    # label appended fire events
+    n_cps = state['n_cps']
+    n_merges = len(state['remap'])
+    cps, state = components.connect_appended(
+        state, vn['x'].values, vn['y'].values, vn['t'].values, radius, gap)
+
+    # append to cp column
+    sidecar.append_column(v_file, 'cp', cps)
+
+    # parameter sweep columns are not extended, drop them
+    for col in sidecar.list_columns(v_file):
+        if col.startswith('cp_'):
+            sidecar.remove_column(v_file, col)
+            print("dropped sweep column '{}' (not appended)".format(col))
+
+    # store component state
+    components.write_state(cwd, state)
+    print('labelled {} appended fire events '
+          '({} new components, {} merges)'.format(
+              len(cps), state['n_cps'] - n_cps,
+              len(state['remap']) - n_merges))
+
+else:
+
+    # fire events (index)
+    n = storage.nrows(v_file)
+
+    # connectivity settings to label, (radius, gap): column name
+    settings = {(radius, gap): 'cp'}
+    if args.radii or args.gaps:
+        for r in args.radii or [radius]:
+            for dt in args.gaps or [gap]:
+                settings.setdefault((r, dt), 'cp_{}_{}'.format(r, dt))
+
+    if args.memory is not None:
+
+        # number of edges/nodes processed at once (~64 bytes each)
+        block_size = max(int(args.memory * 1e9 / 64 / len(settings)), 1)
+
+        # find components, shard by shard
+        ufs = {setting: components.DiskUnionFind(
+            n, os.path.join(cwd, 'uf_{}_{}.npy'.format(*setting)), block_size)
+            for setting in settings}
+        for e_file in sorted(glob.glob(os.path.join(cwd, 'e', '*.pickle'))):
+            e = pd.read_pickle(e_file)
+            for (r, dt), uf in ufs.items():
+                es = select(e, r, dt)
+                uf.union(es.index.get_level_values('s').values,
+                         es.index.get_level_values('t').values)
+                del es
+            del e
+        cpss = {}
+        for (r, dt), uf in ufs.items():
+            cpss[(r, dt)] = components.relabel_roots_by_size(
+                uf.labels(), os.path.join(cwd, 'cp_{}_{}.npy'.format(r, dt)),
+                block_size)
+
+            # free up disk space
+            os.remove(os.path.join(cwd, 'uf_{}_{}.npy'.format(r, dt)))
+        del ufs
+
+    else:
+
+        v = pd.DataFrame(index=range(n))
 
-# fire events (index)
-store = pd.HDFStore(os.path.join(cwd, 'v.h5'), mode='r')
-n = store.get_storer('v').nrows
-store.close()
-v = pd.DataFrame(index=range(n))
+        # load edges
+        e = storage.read_pickle(os.path.join(cwd, 'e.pickle'))
 
-# load edges
-e = pd.read_pickle(os.path.join(cwd, 'e.pickle'))
+        # find components (ties in size labelled as in the out-of-core case)
+        cpss = {}
+        for r, dt in settings:
+            g = dg.DeepGraph(v, select(e, r, dt))
+            g.append_cp()
+            cpss[(r, dt)] = components.relabel_by_size(g.v['cp'].values)
 
-# find components
-g = dg.DeepGraph(v, e)
-g.append_cp()
-cps = g.v['cp'].values
+            # free up memory
+            del g
 
-# free up memory
-del g
-del e
+        del e
 
-# load v.h5
-v = pd.read_hdf(os.path.join(cwd, 'v.h5'))
+    # store cp columns (sidecar of the fire event table), dropping sweep
+    # columns of previous runs
+    for col in sidecar.list_columns(v_file):
+        if col.startswith('cp_') and col not in settings.values():
+            sidecar.remove_column(v_file, col)
+    for setting, col in settings.items():
+        sidecar.write_column(v_file, col, cpss[setting])
+    print('stored {}'.format(sidecar.sidecar_file(v_file)))
+    cps = cpss[(radius, gap)]
 
-# append cp column
-v['cp'] = cps
+    # store component state, for appending new fire events later on
+    t = storage.read_table(v_file, columns=['t'])['t'].values
+    rows = np.flatnonzero(t > t.max() - gap)
+    vf = storage.read_table(v_file, columns=['x', 'y'], coordinates=rows)
+    components.write_state(cwd, components.create_state(
+        n, cps.max() + 1, vf['x'].values, vf['y'].values, t[rows], cps[rows],
+        gap))
+    print('stored {}'.format(os.path.join(cwd, components.state_file)))
 
-# store as hdf (overwrite)
-store = pd.HDFStore(os.path.join(cwd, 'v.h5'), mode='w')
-store.append('v', v, format='t', data_columns=True, index=False)
-store.create_table_index('v', columns=['t', 'dtime'], kind='full')
-store.close()
-print('overwrote {}'.format(os.path.join(cwd, 'v.h5')))
+    if args.memory is not None:
+        del cps, cpss
+        for r, dt in settings:
+            os.remove(os.path.join(cwd, 'cp_{}_{}.npy'.format(r, dt)))
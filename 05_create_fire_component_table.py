@@ -5,12 +5,41 @@
 # MIT license.
 
 import os
+import argparse
 
 import numpy as np
 import pandas as pd
 import geopandas as gpd
 from shapely.geometry import Point
-import deepgraph as dg
+
+from firetracks import aggregate, components, sidecar, footprints, storage
+
+# argument parameters
+parser = argparse.ArgumentParser(
+    description=__doc__,
+    formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+)
+parser.add_argument(
+    '-t', '--time-series',
+    help="additionally create the daily component table cpt.h5 "
+         "(one row per component and day)",
+    action='store_true',
+)
+parser.add_argument(
+    '-f', '--footprints',
+    help="additionally store the cells of each component and day as "
+         "run-length encoded footprints ({}, indexed by {})".format(
+             footprints.records_file, footprints.index_file),
+    action='store_true',
+)
+parser.add_argument(
+    '--storage',
+    help="storage backend of the component tables (cp.h5, cp.parquet or "
+         "cp.zarr, and likewise cpt), see firetracks/storage.py",
+    choices=list(storage.backends),
+    default='hdf',
+)
+args = parser.parse_args()
 
 # file system
 cwd = os.getcwd()
@@ -30,10 +59,13 @@ ndict = {
 }
 
 # load fire events and component information
-v = pd.read_hdf(
-    os.path.join(cwd, 'v.h5'),
-    columns=['t', 'dtime', 'lat', 'lon', 'maxFRP', 'neigh_int', 'gl', 'cp']
-)
+columns = ['t', 'dtime', 'lat', 'lon', 'maxFRP', 'neigh_int', 'gl', 'cp']
+if args.footprints:
+    columns += ['x', 'y']
+v = sidecar.read_table(storage.table_file(cwd, 'v'), columns=columns)
+
+# resolve components merged by appended fire events
+v['cp'] = components.resolve(v['cp'].values, components.read_remap(cwd))
 
 # feature functions, will be applied on each component
 feature_funcs = {
@@ -45,18 +77,33 @@ feature_funcs = {
     'neigh_int': ['min'],
 }
 
+# daily feature functions, applied on each component and day
+daily_feature_funcs = {
+    'dtime': ['first'],
+    'lat': ['mean'],
+    'lon': ['mean'],
+    'maxFRP': ['sum', 'max'],
+}
+
+# sort events by component (and time) once
+if args.time_series:
+    days = aggregate.Segments([v['cp'].values, v['t'].values])
+    seg = days.coarsen(1)
+else:
+    seg = aggregate.Segments([v['cp'].values])
+
 # create spatiotemporal components
-g = dg.DeepGraph(v)
-cp, gv = g.partition_nodes('cp', feature_funcs, return_gv=True)
+cp = seg.aggregate(v, feature_funcs, names=['cp'])
 
 # rename neighbor column
-cp.loc[:, 'neigh_min'] = cp['neigh_int_min'].apply(lambda x: ndict[x])
+cp.loc[:, 'neigh_min'] = cp['neigh_int_min'].map(ndict)
 
 # compute lifetime
 cp.loc[:, 'duration'] = cp['t_max'] - cp['t_min'] + 1
 
 # compute area
-cp.loc[:, 'unique_gls'] = gv['gl'].nunique()
+new_gls = seg.first_occurrence(v['gl'].values)
+cp.loc[:, 'unique_gls'] = np.add.reduceat(new_gls.astype(int), seg.starts)
 cp.loc[:, 'area'] = cp['unique_gls'] * 0.92662543305**2  # page 50 manual
 
 # compute expansion (km^2 day^-1)
@@ -86,10 +133,42 @@ cp.sort_values('dtime_min', kind='mergesort', inplace=True)
 # reset index
 cp.reset_index(inplace=True)
 
-# store cp as hdf
-cp_file = os.path.join(cwd, 'cp.h5')
-store = pd.HDFStore(cp_file, mode='w')
-store.append('cp', cp, format='t', data_columns=True, index=False)
-store.create_table_index('cp', columns=['t_min', 'dtime_min'], kind='full')
-store.close()
+# store cp
+cp_file = storage.table_file(cwd, 'cp', args.storage)
+index_columns = ['t_min', 'dtime_min', 'cp', 'lat_mean', 'lon_mean']
+if 'country' in cp.columns:
+    index_columns.append('country')
+storage.write_table(cp_file, cp, index_columns=index_columns)
 print('stored {}'.format(cp_file))
+
+# create daily component table
+if args.time_series:
+
+    cpt = days.aggregate(v, daily_feature_funcs, names=['cp', 't'])
+    cpt.rename(columns={'dtime_first': 'dtime'}, inplace=True)
+
+    # newly burnt grid locations per day, and cumulatively
+    cpt.loc[:, 'new_gls'] = np.add.reduceat(new_gls.astype(int), days.starts)
+    cpt.loc[:, 'cum_gls'] = cpt.groupby(level='cp')['new_gls'].cumsum()
+
+    # sort like cp.h5 (keeping the dtype of t)
+    cpt.reset_index(inplace=True)
+    cpt = cpt.astype({'t': v['t'].dtype})
+    rank = pd.Series(np.arange(len(cp)), index=cp['cp'].values)
+    cpt = cpt.iloc[np.argsort(rank.loc[cpt['cp'].values].values,
+                              kind='stable')]
+    cpt.reset_index(drop=True, inplace=True)
+
+    # store cpt
+    cpt_file = storage.table_file(cwd, 'cpt', args.storage)
+    storage.write_table(cpt_file, cpt, index_columns=['cp', 'dtime'])
+    print('stored {}'.format(cpt_file))
+
+# store run-length encoded footprints
+if args.footprints:
+
+    runs, offsets = footprints.encode(
+        v['cp'].values, v['t'].values, v['x'].values, v['y'].values,
+        v['cp'].max() + 1)
+    footprints.write(cwd, runs, offsets)
+    print('stored {}'.format(os.path.join(cwd, footprints.records_file)))
@@ -12,6 +12,8 @@ import argparse
 import numpy as np
 import pandas as pd
 
+from firetracks import components, sidecar, shm, storage
+
 # argument parameters
 parser = argparse.ArgumentParser(
     description=__doc__,
@@ -19,7 +21,10 @@ parser = argparse.ArgumentParser(
 )
 parser.add_argument(
     'lc-type',
-    help="which MCD12Q1 Science Data Set to use (short name)",
+    nargs='+',
+    help="which MCD12Q1 Science Data Set(s) to use (short name). Several "
+         "land cover types are processed in one run, sharing the component "
+         "structure of the fire events",
     choices=[
         'LC_Type1',
         'LC_Type2',
@@ -43,7 +48,7 @@ parser.add_argument(
     default=mp.cpu_count(),
 )
 args = parser.parse_args()
-lc_type = getattr(args, 'lc-type')
+lc_types = getattr(args, 'lc-type')
 
 # parameters
 min_perc = .8  # for dominant land use type of a component
@@ -52,72 +57,92 @@ n_proc = 100
 # file system
 cwd = os.getcwd()
 
-# load land cover table, location labels, time and component information
-v = pd.read_hdf(os.path.join(cwd, 'v.h5'), columns=['gl', 't', 'cp'])
-v_lc = pd.read_hdf(os.path.join(cwd, 'v_{}.h5'.format(lc_type)))
-v_lc['cp'] = v['cp'].values
-v_lc['gl'] = v['gl'].values
-v_lc['t'] = v['t'].values
-del v
-
-# load cp.h5 index for sorting
-cp = pd.read_hdf(os.path.join(cwd, 'cp.h5'), columns=['cp', 'dtime_min'])
+# load location labels, time and component information
+v = sidecar.read_table(storage.table_file(cwd, 'v'),
+                       columns=['gl', 't', 'cp'])
+v['cp'] = components.resolve(v['cp'].values, components.read_remap(cwd))
 
-# unique land covers
-lcs = np.sort(pd.unique(v_lc[['lc1', 'lc2', 'lc3', 'lc4']].values.ravel('K')))
+# load cp.h5 index for sorting, and ignition dates
+cp = storage.read_table(storage.table_file(cwd, 'cp'),
+                        columns=['cp', 't_min', 'dtime_min'])
 
 # index array
-n_cps = v_lc['cp'].max() + 1
+n_cps = v['cp'].max() + 1
 n_proc = min(n_proc, n_cps)
 pos_array = np.array(np.linspace(0, n_cps, n_proc), dtype=int)
 
+# ignition date of each component
+t_min = np.zeros(n_cps, dtype=cp['t_min'].dtype)
+t_min[cp['cp'].values] = cp['t_min'].values
+
+# component structure, shared by all land cover types:
+# sort fire events by component (once), row ranges of each chunk
+order = np.argsort(v['cp'].values, kind='stable')
+cps = v['cp'].values[order]
+bounds = shm.row_ranges(cps, pos_array)
+
+# first fire event of each grid location of each component
+first = ~v.duplicated(['cp', 'gl']).values[order]
+
+# fire events at the ignition date of their component
+ignition = (v['t'].values == t_min[v['cp'].values])[order]
+del v
+
+# land cover columns
+lc_cols = ['lc1', 'lc2', 'lc3', 'lc4']
+
 
-# lc value counts
-def lc_vc(group):
-    values = group[['lc1', 'lc2', 'lc3', 'lc4']].values.ravel('K')
-    lc, count = np.unique(values, return_counts=True)
-    df = pd.Series(index=['{}_{}'.format('lc', lcn) for lcn in lcs], data=0)
-    df.loc[['{}_{}'.format('lc', lcn) for lcn in lc]] = count
-    return df
+def lc_count_matrix(cps, codes, n_lcs, n_cps):
+    """Count land cover codes per component (components x land covers)."""
+    return np.bincount(
+        (cps[:, None] * n_lcs + codes).ravel(), minlength=n_cps * n_lcs
+    ).reshape(n_cps, n_lcs)
 
 
 def main(i):
 
     # print('starting {}/{}'.format(i+1, n_proc))
 
-    # subset v_lc
+    # rows of the chunk (shared arrays, see shm.attach)
     from_cp = pos_array[i]
     to_cp = pos_array[i+1]
-    vt_lc = v_lc.loc[(v_lc['cp'] >= from_cp) & (v_lc['cp'] < to_cp)]
-
-    # compute land cover value counts for each cp
-    lcvc = vt_lc.groupby(['cp', 'gl']).nth(0)
-    glcvc = lcvc.groupby('cp')
-    lc_counts = glcvc.apply(lc_vc)
+    rows = slice(bounds[i], bounds[i+1])
+    lcs = shm.arrays['lcs']
+
+    # components (relative to from_cp) and land cover codes
+    cpsi = shm.arrays['cps'][rows] - from_cp
+    codesi = shm.arrays['codes'][rows]
+    index = pd.Index(np.unique(cpsi), name='cp')
+    n_lcs = len(lcs)
+
+    # compute land cover value counts for each cp (first fire event of
+    # each grid location)
+    firsti = shm.arrays['first'][rows]
+    counts = lc_count_matrix(
+        cpsi[firsti], codesi[firsti], n_lcs, to_cp - from_cp)
+    counts = counts[index.values]
+    lc_counts = pd.DataFrame(
+        counts, index=index + from_cp,
+        columns=['lc_{}'.format(lcn) for lcn in lcs])
 
     # lc proportions
-    plc = lc_counts.divide(lc_counts.sum(axis=1), axis=0)
-    plc.columns = ['p{}'.format(col) for col in plc.columns]
+    props = counts / counts.sum(axis=1, keepdims=True)
+    plc = pd.DataFrame(
+        props, index=lc_counts.index,
+        columns=['plc_{}'.format(lcn) for lcn in lcs])
 
     # dominant land cover
-    dlc = plc.idxmax(axis=1)
-    dlc = dlc.apply(lambda x: x[x.find('_') + 1:])
-    dlc.loc[(plc < min_perc).all(axis=1)] = 'None'
-    dlc.name = 'dlc'
-
-    # first land cover types
-    flcs = []
-    for n in [1, 2, 3, 4]:
-        flc = vt_lc.groupby(['cp', 't', 'lc{}'.format(n)]).size()
-        flc = flc.unstack(fill_value=0)
-        flc = flc.groupby('cp').nth(0)
-        for lc in lcs:
-            if lc not in flc.columns.values:
-                flc.loc[:, lc] = 0
-        flc = flc[lcs]
-        flcs.append(flc)
-    flc = sum(flcs)
-    flc.columns = ['flc_{}'.format(lc) for lc in lcs]
+    dlc = np.where(props.max(axis=1) < min_perc, 'None',
+                   lcs.astype(str)[props.argmax(axis=1)])
+    dlc = pd.Series(dlc, index=lc_counts.index, name='dlc', dtype=object)
+
+    # first land cover types (fire events at the ignition date)
+    ignitioni = shm.arrays['ignition'][rows]
+    counts = lc_count_matrix(
+        cpsi[ignitioni], codesi[ignitioni], n_lcs, to_cp - from_cp)
+    flc = pd.DataFrame(
+        counts[index.values], index=lc_counts.index,
+        columns=['flc_{}'.format(lcn) for lcn in lcs])
 
     # concat
     cpt_lc = pd.concat((lc_counts, plc, dlc, flc), axis=1)
@@ -129,27 +154,46 @@ if __name__ == '__main__':
 
     indices = np.arange(0, n_proc - 1)
 
-    # compute component tables
-    cpt_lcs = Pool(args.processes).map(main, indices)
-
-    # concat
-    cp_lc = pd.concat(cpt_lcs)
-
-    # sort like cp.h5
-    cp_lc = cp_lc.loc[cp['cp'].values]
-
-    # add dtime
-    cp_lc['dtime_min'] = cp['dtime_min'].values
-
-    # reset index
-    cp_lc.reset_index(inplace=True)
-
-    # store cp as hdf5
-    cp_lc_file = os.path.join(cwd, 'cp_{}.h5'.format(lc_type))
-    store = pd.HDFStore(cp_lc_file, mode='w')
-    store.append('cp_{}'.format(lc_type), cp_lc, format='t', data_columns=True,
-                 index=False)
-    store.create_table_index('cp_{}'.format(lc_type), columns=['dtime_min'],
-                             kind='full')
-    store.close()
-    print('stored {}'.format(cp_lc_file))
+    # publish component structure to the workers
+    with shm.published(
+            {'cps': cps, 'first': first, 'ignition': ignition}) as spec:
+        del cps, first, ignition
+
+        for lc_type in lc_types:
+
+            # load land cover table, unique land covers, land cover codes
+            v_lc = storage.read_table(
+                os.path.join(cwd, 'v_{}.h5'.format(lc_type)),
+                columns=lc_cols).values
+            lcs = np.sort(pd.unique(v_lc.ravel('K')))
+            codes = np.searchsorted(lcs, v_lc)[order].astype(np.uint8)
+            del v_lc
+
+            # publish land cover codes to the workers, compute component tables
+            with shm.published({'lcs': lcs, 'codes': codes}) as lc_spec:
+                del codes
+                with Pool(args.processes, initializer=shm.attach,
+                          initargs=(dict(spec, **lc_spec),)) as pool:
+                    cpt_lcs = pool.map(main, indices)
+
+            # concat
+            cp_lc = pd.concat(cpt_lcs)
+
+            # sort like cp.h5
+            cp_lc = cp_lc.loc[cp['cp'].values]
+
+            # add dtime
+            cp_lc['dtime_min'] = cp['dtime_min'].values
+
+            # reset index
+            cp_lc.reset_index(inplace=True)
+
+            # store cp as hdf5
+            cp_lc_file = os.path.join(cwd, 'cp_{}.h5'.format(lc_type))
+            store = pd.HDFStore(cp_lc_file, mode='w')
+            store.append('cp_{}'.format(lc_type), cp_lc, format='t',
+                         data_columns=True, index=False)
+            store.create_table_index('cp_{}'.format(lc_type),
+                                     columns=['dtime_min'], kind='full')
+            store.close()
+            print('stored {}'.format(cp_lc_file))
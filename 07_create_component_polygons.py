@@ -6,6 +6,8 @@
 # MIT license.
 
 import os
+import shutil
+import contextlib
 import multiprocessing as mp
 from multiprocessing import Pool
 import argparse
@@ -13,7 +15,9 @@ import argparse
 import numpy as np
 import pandas as pd
 import geopandas as gpd
-from shapely.geometry import Point, Polygon
+from shapely.geometry import mapping
+
+from firetracks import components, sidecar, shm, aggregate, polygons, storage
 
 # argument parameters
 parser = argparse.ArgumentParser(
@@ -25,6 +29,24 @@ parser.add_argument(
     help="create (multi)polygon for each time slice of a component",
     action='store_true',
 )
+parser.add_argument(
+    '-c', '--cumulative',
+    help="create (multi)polygon of the cumulative footprint (burned area to "
+         "date) at each time slice of a component, built incrementally day "
+         "by day (stored as cpt_cum_poly). Can be combined with "
+         "--slice-by-time, computing both in one pass",
+    action='store_true',
+)
+parser.add_argument(
+    '-f', '--formats',
+    nargs='+',
+    help="output format(s): GeoPackage (.gpkg), GeoParquet partitioned by "
+         "year of 'dtime_min' into hive directories, sorted along a Hilbert "
+         "curve, with a bbox covering column (.parquet), and/or FlatGeobuf "
+         "with a packed Hilbert R-tree (.fgb)",
+    choices=['gpkg', 'parquet', 'fgb'],
+    default=['gpkg'],
+)
 parser.add_argument(
     '-p', '--processes',
     help="number of processes to use for the computation",
@@ -32,161 +54,233 @@ parser.add_argument(
     default=mp.cpu_count(),
 )
 args = parser.parse_args()
+if 'parquet' in args.formats and int(gpd.__version__.split('.')[0]) < 1:
+    # (bbox covering column)
+    parser.error('GeoParquet output requires geopandas>=1.0, found '
+                 'geopandas {}'.format(gpd.__version__))
 
 # parameters
 n_proc = 100
+# max. rows of a GeoParquet file, and rows of its row groups
+parquet_rows = 2**20
+parquet_row_group = 2**14
 
 # file system
 cwd = os.getcwd()
+
+# outputs (file name, cumulative footprints), grouping by time slices
+outputs = []
 if args.slice_by_time:
-    fname = os.path.join(cwd, 'cpt_poly')
-else:
-    fname = os.path.join(cwd, 'cp_poly')
-
-# MODIS constants
-# the height and width of each MODIS tile in the projection plane [m]
-T = 1111950.5196666666
-# the western/eastern limit of the projection plane [m]
-xmin = -20015109.354
-xmax = 20015109.354
-# the northern/southern limit of the projection plane [m]
-ymax = 10007554.677
-ymin = -10007554.677
-# the actual size of a "1-km" MODIS sinusoidal grid cell (926.6254330 m)
-w = T/1200.
+    outputs.append((os.path.join(cwd, 'cpt_poly'), False))
+if args.cumulative:
+    outputs.append((os.path.join(cwd, 'cpt_cum_poly'), True))
+if not outputs:
+    outputs.append((os.path.join(cwd, 'cp_poly'), False))
+by_time = args.slice_by_time or args.cumulative
 
 # load fire event dataframe
-v = pd.read_hdf(os.path.join(cwd, 'v.h5'),
-                columns=['lat', 'lon', 'H', 'V', 'i', 'j', 't', 'cp'])
-
-# convert to geodataframe
-v = gpd.GeoDataFrame(v, crs='epsg:4326',
-                     geometry=[Point(xy) for xy in zip(v['lon'], v['lat'])])
+v = sidecar.read_table(storage.table_file(cwd, 'v'),
+                       columns=['H', 'V', 'i', 'j', 't', 'cp'])
+v['cp'] = components.resolve(v['cp'].values, components.read_remap(cwd))
 
-# load cp.h5 index for sorting
-cp = pd.read_hdf(os.path.join(cwd, 'cp.h5'), columns=['cp'])
+# load cp.h5 index for sorting, and ignition dates
+cp = storage.read_table(storage.table_file(cwd, 'cp'),
+                        columns=['cp', 'dtime_min'])
 
-# index array
+# index array (over the position of components in cp.h5)
 n_cps = v['cp'].max() + 1
 n_proc = min(n_proc, n_cps)
 pos_array = np.array(np.linspace(0, n_cps, n_proc), dtype=int)
 
-
-def corners_to_poly(H, V, i, j):
-    """Convert MODIS coordinates to geographic coordinates.
-
-    Take the H/V (MODIS box) and i/j (pixel within box) coordinates and convert
-    to geographic coordinates.
-
-    Adapted from: https://code.env.duke.edu/projects/mget/wiki/SinusoidalMODIS
-
-    """
-
-    # x/y min/max
-    min_x = xmin + H*T + j * w
-    max_x = xmin + H*T + (j + 1.) * w
-    min_y = ymax - V*T - i * w
-    max_y = ymax - V*T - (i + 1) * w
-
-    # check for edge wrapping
-    if min_y < ymin:
-        min_y = ymin - min_y
-    if max_y > ymax:
-        max_y = ymax - max_y
-    if min_x < xmin:
-        min_x = xmin - min_x
-    if max_x > xmax:
-        max_x = xmax - max_x
-
-    # create shapely polygon from corner coordinates
-    geom = Polygon(
-        ((min_x, max_y),
-         (max_x, max_y),
-         (max_x, min_y),
-         (min_x, min_y),
-         (min_x, max_y))
-    )
-
-    return geom
-
-
-def to_poly(group):
-    """Convert set of fire events to polygons."""
-
-    # create geometries from events
-    geometries = []
-    for _, row in group.iterrows():
-        geometry = corners_to_poly(row['H'], row['V'], row['i'], row['j'])
-        geometries.append(geometry)
-
-    # convert to single polygon
-    vt_poly = gpd.GeoDataFrame(
-        crs='+proj=sinu +R=6371007.181 +nadgrids=@null +wktext',
-        geometry=geometries,
-    )
-
-    # dissolve polygons
-    vt_poly['dissolvefield'] = 1
-    vt_poly = vt_poly.dissolve('dissolvefield')
+# position of each component in cp.h5
+rank = np.empty(n_cps, dtype=np.int64)
+rank[cp['cp'].values] = np.arange(len(cp))
+
+# sort fire events like cp.h5, global grid rows/cols of the fire events,
+# row ranges of each chunk
+v['rank'] = rank[v['cp'].values]
+v = v.iloc[np.argsort(v['rank'].values, kind='stable')]
+columns = {
+    'row': v['V'].values.astype(np.int32) * 1200 + v['i'].values,
+    'col': v['H'].values.astype(np.int32) * 1200 + v['j'].values,
+    't': v['t'].values,
+    'cp': v['cp'].values,
+    'rank': v['rank'].values,
+}
+bounds = shm.row_ranges(columns['rank'], pos_array)
+del v, rank
+
+
+def to_frame(polys, index):
+    """Geodataframe (WGS84) of (geometry, area, perimeter) tuples."""
+    geometries, areas, perimeters = zip(*polys)
+    cpt_poly = gpd.GeoDataFrame(
+        geometry=list(geometries), index=index, crs=polygons.crs)
+    cpt_poly['area'] = np.array(areas, dtype=float)
+    cpt_poly['perimeter'] = np.array(perimeters, dtype=float)
 
     # reproject to WGS84
-    vt_poly = vt_poly.to_crs('epsg:4326')
+    cpt_poly = cpt_poly.to_crs('epsg:4326')
 
-    return vt_poly
+    return cpt_poly
 
 
 def main(i):
 
     # print('starting {}/{}'.format(i+1, n_proc))
 
-    # subset v by components
-    from_cp = pos_array[i]
-    to_cp = pos_array[i+1]
-    vt = v.loc[(v['cp'] >= from_cp) & (v['cp'] < to_cp)]
+    # subset v by components (shared arrays, see shm.attach)
+    rows = slice(bounds[i], bounds[i+1])
+    vt = {col: shm.arrays[col][rows]
+          for col in ['row', 'col', 't', 'cp', 'rank']}
 
-    # group by component, and optionally time
-    if args.slice_by_time:
-        gvt = vt.groupby(['cp', 't'])
+    # group by component (in order of cp.h5), and optionally time
+    if by_time:
+        names = ['cp', 't']
+        seg = aggregate.Segments([vt['rank'], vt['t']])
     else:
-        gvt = vt.groupby('cp')
+        names = ['cp']
+        seg = aggregate.Segments([vt['rank']])
+    keys = [vt[name][seg.order][seg.starts] for name in names]
+    grid_rows = vt['row'][seg.order]
+    grid_cols = vt['col'][seg.order]
+
+    if len(names) == 1:
+        index = pd.Index(keys[0], name='cp')
+    else:
+        index = pd.MultiIndex.from_arrays(keys, names=names)
 
-    # create geodataframe
-    cpt_poly = gvt.apply(to_poly)
+    # polygonize (geometry, area [km^2], perimeter [km]) for each output
+    cpt_polys = []
+    for _, cumulative in outputs:
 
-    # drop index level
-    cpt_poly.index = cpt_poly.index.droplevel('dissolvefield')
+        if not cumulative:
+            # cells of each group
+            polys = [polygons.cells_to_polygon(grid_rows[start:end],
+                                               grid_cols[start:end])
+                     for start, end in zip(seg.starts, seg.ends)]
 
-    return cpt_poly
+        else:
+            # footprint of each component, grown time slice by time slice
+            polys = []
+            comps = seg.coarsen(1)
+            k = 0
+            for cstart, cend in zip(comps.starts, comps.ends):
+                footprint = polygons.Footprint(grid_rows[cstart:cend],
+                                               grid_cols[cstart:cend])
+                while k < len(seg) and seg.starts[k] < cend:
+                    start, end = seg.starts[k], seg.ends[k]
+                    footprint.add(grid_rows[start:end], grid_cols[start:end])
+                    polys.append(footprint.to_polygon())
+                    k += 1
 
+        cpt_polys.append(to_frame(polys, index))
 
-if __name__ == '__main__':
+    return cpt_polys
 
-    indices = np.arange(0, n_proc - 1)
 
-    # compute polygons
-    cpt_polys = Pool(processes=args.processes).map(main, indices)
+def write_parquet(fname, year, parts, k):
+    """Write buffered polygons of a year to GeoParquet file number `k`.
 
-    # concat
-    cp_poly = pd.concat(cpt_polys)
+    The rows are sorted along a Hilbert curve of their bbox centers, so that
+    the bbox statistics of the row groups are spatially compact.
 
-    # add area
-    cp_poly['area'] = cp_poly['geometry'].to_crs({'proj':'cea'}).map(
-        lambda x: x.area / 10**6)
+    """
+    cpt_poly = pd.concat(parts, ignore_index=True)
+    hilbert = cpt_poly.geometry.hilbert_distance(
+        total_bounds=(-180, -90, 180, 90)).values
+    cpt_poly = cpt_poly.iloc[np.argsort(hilbert, kind='stable')]
+    path = os.path.join(fname + '.parquet', 'year={}'.format(year))
+    os.makedirs(path, exist_ok=True)
+    cpt_poly.to_parquet(os.path.join(path, 'part-{:05d}.parquet'.format(k)),
+                        index=False, write_covering_bbox=True,
+                        row_group_size=parquet_row_group)
 
-    # add perimeter
-    cp_poly['perimeter'] = cp_poly['geometry'].to_crs({'proj':'cea'}).map(
-        lambda x: x.length / 10**3)
 
-    # sort like cp.h5
-    cp_poly = cp_poly.loc[cp['cp'].values]
+def to_records(cpt_poly):
+    """Convert a chunk of polygons to records, for fiona."""
+    properties = cpt_poly.drop(columns='geometry').to_dict('records')
+    for props, geometry in zip(properties, cpt_poly.geometry):
+        yield {'geometry': mapping(geometry), 'properties': props}
 
-    # reset index
-    cp_poly.reset_index(inplace=True)
 
-    # dtypes
-    if args.slice_by_time:
-        cp_poly = cp_poly.astype({'t': np.uint16})  # not stored as such :/
+if __name__ == '__main__':
+
+    indices = np.arange(0, n_proc - 1)
 
-    # store
-    cp_poly.to_file(fname + '.gpkg', driver='GPKG')
-    print('stored {}'.format(fname + '.gpkg'))
+    # layer schema
+    properties = {'cp': 'int'}
+    if by_time:
+        properties['t'] = 'int'
+    properties['area'] = 'float'
+    properties['perimeter'] = 'float'
+    schema = {'geometry': 'Unknown', 'properties': properties}
+
+    # fiona drivers
+    drivers = {'gpkg': 'GPKG', 'fgb': 'FlatGeobuf'}
+    if any(fmt in drivers for fmt in args.formats):
+        # optional dependencies (not needed for GeoParquet)
+        import fiona
+        from pyproj import CRS
+
+    # remove previous output
+    for fname, _ in outputs:
+        for fmt in args.formats:
+            if os.path.isdir(fname + '.' + fmt):
+                shutil.rmtree(fname + '.' + fmt)
+            elif os.path.isfile(fname + '.' + fmt):
+                os.remove(fname + '.' + fmt)
+
+    # ignition date of each component (parquet partitions)
+    dtime_min = cp.set_index('cp')['dtime_min']
+
+    # GeoParquet rows buffered per file and year, and the number of files
+    # written per file and year (see `parquet_rows`)
+    buffered = {}
+    n_written = {}
+
+    # compute polygons, and append them chunk by chunk (in order of cp.h5)
+    # to a single open layer per file. The spatial index of a new layer is
+    # created by GDAL once, when the file is closed
+    with contextlib.ExitStack() as stack:
+
+        # publish fire events to the workers
+        spec = stack.enter_context(shm.published(columns))
+        del columns
+
+        pool = stack.enter_context(Pool(
+            processes=args.processes, initializer=shm.attach,
+            initargs=(spec,)))
+        dsts = [[stack.enter_context(fiona.open(
+            fname + '.' + fmt, 'w', driver=drivers[fmt], schema=schema,
+            crs_wkt=CRS('epsg:4326').to_wkt(),
+            layer=os.path.basename(fname)))
+            for fmt in args.formats if fmt in drivers]
+            for fname, _ in outputs]
+
+        for cpt_polys in pool.imap(main, indices):
+            for (fname, _), odsts, cpt_poly in zip(outputs, dsts, cpt_polys):
+                cpt_poly = cpt_poly.reset_index()
+                for dst in odsts:
+                    dst.writerecords(to_records(cpt_poly))
+
+                # buffer GeoParquet rows per year, write full buffers
+                if 'parquet' in args.formats:
+                    cpt_poly['dtime_min'] = dtime_min.loc[
+                        cpt_poly['cp']].values
+                    years = cpt_poly['dtime_min'].dt.year.values
+                    for year in np.unique(years):
+                        parts = buffered.setdefault((fname, year), [])
+                        parts.append(cpt_poly.loc[years == year])
+                        if sum(len(part) for part in parts) >= parquet_rows:
+                            n = n_written.get((fname, year), 0)
+                            write_parquet(fname, year, parts, n)
+                            n_written[(fname, year)] = n + 1
+                            del buffered[(fname, year)]
+
+    # write the remaining GeoParquet rows
+    for (fname, year), parts in buffered.items():
+        write_parquet(fname, year, parts, n_written.get((fname, year), 0))
+    for fname, _ in outputs:
+        for fmt in args.formats:
+            print('stored {}'.format(fname + '.' + fmt))
@@ -149,10 +149,45 @@ cp = {'Name':
       'Data Type':
 
       ['int64', 'int64', 'uint16', 'uint16', 'datetime64', 'datetime64',
-       'float64', 'float64', 'float64', 'float64', 'uint8', 'string', 'uint16',
+       'float64', 'float64', 'float64', 'int64', 'uint8', 'string', 'uint16',
        'uint32', 'float64', 'float64', 'string', 'string']}
 
 
+# ----------------------------------------------------------------------------
+# cpt.h5
+
+cpt = {'Name':
+
+       ['cp', 't', 'n_nodes', 'dtime', 'lat_mean', 'lon_mean', 'maxFRP_sum',
+        'maxFRP_max', 'new_gls', 'cum_gls'],
+
+       'Description':
+
+       ['component index', 'days since 2002-01-01',
+        'number of fire events at given day', 'date (YYYY-MM-DD)',
+        'mean location latitude at given day',
+        'mean location longitude at given day',
+        'sum of maximum fire radiative powers at given day',
+        'maximum of maximum fire radiative powers at given day',
+        'number of grid locations burnt for the first time at given day',
+        'number of grid locations burnt up to (including) given day'],
+
+       'Unit':
+
+       ['-', 'days since 2002-01-01', '-', '-', 'degrees', 'degrees',
+        'MW*10', 'MW*10', '-', '-'],
+
+       'Valid Range':
+
+       ['>= 0', '>= 0', '>= 1', '>= 2002-01-01', '[-180, 180]', '[-90, 90]',
+        '>= 0', '>= 0', '>= 0', '>= 1'],
+
+       'Data Type':
+
+       ['int64', 'uint16', 'int64', 'datetime64', 'float64', 'float64',
+        'int64', 'int32', 'int64', 'int64']}
+
+
 # ----------------------------------------------------------------------------
 # cp_lc.h5
 
@@ -201,7 +236,7 @@ cp_poly = {'Name':
 
            'Valid Range':
 
-           ['>= 0', '>= 0.86 (1 MODIS pixel)', '>= 3.71 (1 MODIS pixel)', '-'],
+           ['>= 0', '>= 0.86 (1 MODIS pixel)', '>= 3.70 (1 MODIS pixel)', '-'],
 
            'Data Type':
 
@@ -228,7 +263,7 @@ cpt_poly = {'Name':
             'Valid Range':
 
             ['>= 0', '>= 0', '>= 0.86 (1 MODIS pixel)',
-             '>= 3.71 (1 MODIS pixel)', '-'],
+             '>= 3.70 (1 MODIS pixel)', '-'],
 
             'Data Type':
 
@@ -237,8 +272,8 @@ cpt_poly = {'Name':
 
 # ----------------------------------------------------------------------------
 # convert
-dfs = [v, v_lc, cp, cp_lc, cp_poly, cpt_poly]
-names = ['v', 'v_lc', 'cp', 'cp_lc', 'cp_poly', 'cpt_poly']
+dfs = [v, v_lc, cp, cpt, cp_lc, cp_poly, cpt_poly]
+names = ['v', 'v_lc', 'cp', 'cpt', 'cp_lc', 'cp_poly', 'cpt_poly']
 
 for df, name in zip(dfs, names):
     convert_to_different_formats(df, name)
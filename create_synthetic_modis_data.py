@@ -0,0 +1,377 @@
+
+# Copyright (C) 2021 by
+# Dominik Traxl <dominik.traxl@posteo.org>
+# All rights reserved.
+# MIT license.
+
+# Creates synthetic MOD14A1/MYD14A1 (fire) and MCD12Q1 (land cover) HDF4
+# granules, to run and benchmark the scripts of the pipeline offline, at any
+# scale. The granules have the file names, attributes ('Dates', 'FirePix')
+# and SDS ('FireMask', 'MaxFRP', 'sample', land cover types) read by
+# 01_create_fire_event_table.py and 02_create_land_cover_table.py.
+
+# FIRES
+# Fires ignite at random cells of each tile (Poisson, `--density` per tile
+# and day, with a seasonal cycle), and spread from day to day: each burning
+# cell ignites each of its 8 neighbours (and burns on itself) the next day
+# with probability `--spread`, until the fire dies out (after a geometric
+# number of days, with mean `--duration`). Each satellite detects a burning
+# cell with probability `--detection`, unless it is covered by clouds.
+
+# Granules of existing (satellite, year, day, H, V) are never overwritten, so
+# that synthetic data does not shadow downloaded data (better: use an empty
+# directory, see `--output`).
+
+import os
+import argparse
+import multiprocessing as mp
+from multiprocessing import Pool
+from datetime import datetime, timedelta
+
+import numpy as np
+from pyhdf.SD import SD, SDC
+
+# argument parameters
+parser = argparse.ArgumentParser(
+    description=__doc__,
+    formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+)
+parser.add_argument(
+    '-o', '--output',
+    help="directory to store the MOD14A1, MYD14A1 and MCD12Q1 folders in "
+         "(default: current working directory)",
+    type=str,
+)
+parser.add_argument(
+    '--from-year',
+    help="first year of fire granules",
+    type=int,
+    default=2019,
+)
+parser.add_argument(
+    '--to-year',
+    help="last year of fire granules (land cover granules are created for "
+         "the years before each year, see 02_create_land_cover_table.py)",
+    type=int,
+    default=2019,
+)
+parser.add_argument(
+    '--tiles',
+    nargs='+',
+    help="MODIS tiles H,V to create granules for, e.g. 8,5 9,5",
+    type=str,
+    default=['8,5'],
+)
+parser.add_argument(
+    '--all-tiles',
+    help="create granules for all 36x18 MODIS tiles (global scale)",
+    action='store_true',
+)
+parser.add_argument(
+    '--satellites',
+    nargs='+',
+    help="satellites to create fire granules for",
+    choices=['MOD', 'MYD'],
+    default=['MOD', 'MYD'],
+)
+parser.add_argument(
+    '--density',
+    help="mean number of ignitions per tile and day",
+    type=float,
+    default=5.,
+)
+parser.add_argument(
+    '--spread',
+    help="probability that a burning cell ignites a neighbouring cell (or "
+         "burns on itself) the next day",
+    type=float,
+    default=.15,
+)
+parser.add_argument(
+    '--duration',
+    help="mean number of days a fire spreads",
+    type=float,
+    default=4.,
+)
+parser.add_argument(
+    '--seasonality',
+    help="amplitude of the seasonal cycle of ignitions (0: none, 1: no "
+         "ignitions half a year from the peak)",
+    type=float,
+    default=.8,
+)
+parser.add_argument(
+    '--peak-day',
+    help="day of the year with the most ignitions",
+    type=int,
+    default=220,
+)
+parser.add_argument(
+    '--detection',
+    help="probability that a satellite detects a burning cell",
+    type=float,
+    default=.7,
+)
+parser.add_argument(
+    '--clouds',
+    help="fraction of cloud covered cells (in blocks of 40x40 cells)",
+    type=float,
+    default=.1,
+)
+parser.add_argument(
+    '--no-land-cover',
+    help="do not create MCD12Q1 granules",
+    action='store_true',
+)
+parser.add_argument(
+    '--seed',
+    help="random seed (granules are reproducible for a given seed)",
+    type=int,
+    default=0,
+)
+parser.add_argument(
+    '-p', '--processes',
+    help="number of processes to use for the computation",
+    type=int,
+    default=mp.cpu_count(),
+)
+args = parser.parse_args()
+
+# file system
+cwd = args.output or os.getcwd()
+data_dirs = {sat: os.path.join(cwd, sat + product) for sat, product in
+             [('MOD', '14A1'), ('MYD', '14A1'), ('MCD', '12Q1')]}
+for data_dir in data_dirs.values():
+    os.makedirs(data_dir, exist_ok=True)
+
+# parameters
+# size of a tile (1-km fire, 500-m land cover)
+n = 1200
+n_lc = 2400
+# first days of the 8-day fire granules
+fdays = np.arange(1, 365, 8)
+# fire pixel classes (as stored in the files, see 01_create_fire_event_table
+# .py), and probabilities of the fire classes (low, nominal, high)
+cloud = 4
+land = 5
+fire_classes = [7, 8, 9]
+fire_p = [.2, .5, .3]
+# maximum fire radiative power [MW] (lognormal), stored as MW * 10
+frp_median = 20.
+frp_sigma = 1.
+# offsets of the cells a burning cell spreads to
+offsets = [(di, dj) for di in (-1, 0, 1) for dj in (-1, 0, 1)]
+# size of cloud blocks [cells]
+cloud_block = 40
+# size of land cover patches [cells]
+lc_patch = 40
+
+# class values of each land cover SDS of MCD12Q1
+lc_classes = {
+    'LC_Type1': np.arange(1, 18),
+    'LC_Type2': np.arange(0, 16),
+    'LC_Type3': np.arange(1, 11),
+    'LC_Type4': np.arange(0, 9),
+    'LC_Type5': np.arange(0, 12),
+    'LC_Prop1': np.array([1, 2, 3, 11, 12, 13, 14, 15, 16, 21, 22, 31, 32,
+                          41, 42, 43]),
+    'LC_Prop2': np.array([1, 2, 3, 9, 10, 20, 25, 30, 35, 36, 40]),
+    'LC_Prop3': np.array([1, 2, 3, 27, 50, 51]),
+    'LC_Prop1_Assessment': np.arange(0, 101),
+    'LC_Prop2_Assessment': np.arange(0, 101),
+    'LC_Prop3_Assessment': np.arange(0, 101),
+    'QC': np.arange(0, 11),
+    'LW': np.array([1, 2]),
+}
+
+# tiles
+if args.all_tiles:
+    tiles = [(H, V) for H in range(36) for V in range(18)]
+else:
+    tiles = [tuple(int(k) for k in tile.split(',')) for tile in args.tiles]
+
+# time line (days of all fire granules, the last one reaching into the next
+# year)
+years = np.arange(args.from_year, args.to_year + 1)
+t0 = datetime(args.from_year, 1, 1)
+n_days = (datetime(args.to_year + 1, 1, 1) - t0).days + 7
+doy = np.array([(t0 + timedelta(days=day)).timetuple().tm_yday
+                for day in range(n_days)])
+seasonal = 1 + args.seasonality * np.cos(
+    2 * np.pi * (doy - args.peak_day) / 365.25)
+
+
+# to extract metadata from file (see 01_create_fire_event_table.py)
+def meta_from_file(f):
+    satellite = f[:3]
+    year = f[9:13]
+    fday = f[13:16]
+    H = f[18:20]
+    V = f[21:23]
+    return satellite, year, fday, H, V
+
+
+# existing granules
+existing = {meta_from_file(fname) for data_dir in data_dirs.values()
+            for fname in os.listdir(data_dir) if fname.endswith('.hdf')}
+
+
+def granule_file(satellite, year, fday, H, V):
+    """Path of a granule, or None if it exists already."""
+    if (satellite, str(year), str(fday).zfill(3), str(H).zfill(2),
+            str(V).zfill(2)) in existing:
+        return None
+    product = '12Q1' if satellite == 'MCD' else '14A1'
+    fname = '{}{}.A{}{:03d}.h{:02d}v{:02d}.006.{}{:03d}000000.hdf'.format(
+        satellite, product, year, fday, H, V, year, fday)
+    return os.path.join(data_dirs[satellite], fname)
+
+
+def write_sds(sd, name, data, dtype):
+    sds = sd.create(name, dtype, data.shape)
+    sds.setcompress(SDC.COMP_DEFLATE, value=6)
+    sds[:] = data
+    sds.endaccess()
+
+
+def simulate_fires(rng):
+    """Burning cells of the spreading fires of a tile.
+
+    Returns the days (since t0), rows and cols of the burning cells, sorted
+    by day.
+
+    """
+    i = np.empty(0, dtype=np.int64)
+    j = np.empty(0, dtype=np.int64)
+    end = np.empty(0, dtype=np.int64)
+
+    days = []
+    rows = []
+    cols = []
+    for day in range(n_days):
+
+        # spread to the neighbouring cells (and the cell itself)
+        if len(i) > 0:
+            spread = rng.random((len(offsets), len(i))) < args.spread
+            i = np.concatenate([i[m] + di for (di, _), m in
+                                zip(offsets, spread)])
+            j = np.concatenate([j[m] + dj for (_, dj), m in
+                                zip(offsets, spread)])
+            end = np.concatenate([end[m] for m in spread])
+
+            # fires die out, do not spread beyond the tile
+            keep = (end >= day) & (i >= 0) & (i < n) & (j >= 0) & (j < n)
+            i, j, end = i[keep], j[keep], end[keep]
+
+            # unique cells
+            _, first = np.unique(i * n + j, return_index=True)
+            i, j, end = i[first], j[first], end[first]
+
+        # ignitions
+        n_ign = rng.poisson(args.density * seasonal[day])
+        i = np.append(i, rng.integers(0, n, n_ign))
+        j = np.append(j, rng.integers(0, n, n_ign))
+        end = np.append(
+            end, day + rng.geometric(1 / args.duration, n_ign) - 1)
+
+        days.append(np.full(len(i), day))
+        rows.append(i)
+        cols.append(j)
+
+    return np.concatenate(days), np.concatenate(rows), np.concatenate(cols)
+
+
+def create_fire_granule(rng, path, day0, fire_days, fire_i, fire_j):
+    """MOD14A1/MYD14A1 granule of 8 days, starting at day0 (since t0)."""
+
+    # fire mask, clouds (in blocks)
+    fm = np.full((8, n, n), land, dtype=np.uint8)
+    blocks = rng.random((8, n // cloud_block, n // cloud_block)) < args.clouds
+    fm[blocks.repeat(cloud_block, axis=1).repeat(cloud_block, axis=2)] = cloud
+
+    # detected fires
+    detected = rng.random(len(fire_days)) < args.detection
+    d = fire_days[detected] - day0
+    i = fire_i[detected]
+    j = fire_j[detected]
+    clear = fm[d, i, j] != cloud
+    d, i, j = d[clear], i[clear], j[clear]
+    fm[d, i, j] = rng.choice(fire_classes, len(d), p=fire_p)
+
+    # maximum fire radiative power, sample number
+    frp = np.zeros((8, n, n), dtype=np.int32)
+    frp[d, i, j] = np.round(
+        rng.lognormal(np.log(frp_median), frp_sigma, len(d)) * 10)
+    sample = np.zeros((8, n, n), dtype=np.int16)
+    sample[d, i, j] = rng.integers(0, 1354, len(d))
+
+    # dates
+    dates = [t0 + timedelta(days=int(day0) + k) for k in range(8)]
+
+    # store
+    sd = SD(path, SDC.WRITE | SDC.CREATE | SDC.TRUNC)
+    sd.attr('Dates').set(
+        SDC.CHAR8, ' '.join(date.strftime('%Y-%m-%d') for date in dates))
+    sd.attr('FirePix').set(
+        SDC.INT32, [int(k) for k in (fm >= 7).sum(axis=(1, 2))])
+    write_sds(sd, 'FireMask', fm, SDC.UINT8)
+    write_sds(sd, 'MaxFRP', frp, SDC.INT32)
+    write_sds(sd, 'sample', sample, SDC.INT16)
+    sd.end()
+
+    return len(d)
+
+
+def create_land_cover_granule(rng, path, patches):
+    """MCD12Q1 granule, land cover classes in patches."""
+    sd = SD(path, SDC.WRITE | SDC.CREATE | SDC.TRUNC)
+    for lc_type, classes in lc_classes.items():
+        lut = rng.choice(classes, patches.max() + 1).astype(np.uint8)
+        write_sds(sd, lc_type, lut[patches], SDC.UINT8)
+    sd.end()
+
+
+def main(tile):
+
+    H, V = tile
+    rng = np.random.default_rng([args.seed, H, V])
+
+    # fires
+    fire_days, fire_i, fire_j = simulate_fires(rng)
+    n_granules = 0
+    n_fires = 0
+    for year in years:
+        for fday in fdays:
+            day0 = (datetime(int(year), 1, 1) - t0).days + int(fday) - 1
+            lo, hi = np.searchsorted(fire_days, [day0, day0 + 8])
+            for satellite in args.satellites:
+                path = granule_file(satellite, year, fday, H, V)
+                if path is None:
+                    continue
+                n_fires += create_fire_granule(
+                    rng, path, day0, fire_days[lo:hi], fire_i[lo:hi],
+                    fire_j[lo:hi])
+                n_granules += 1
+
+    # land cover (patches of the same land cover each year)
+    if not args.no_land_cover:
+        m = n_lc // lc_patch
+        patches = np.arange(m * m).reshape(m, m)
+        patches = patches.repeat(lc_patch, axis=0).repeat(lc_patch, axis=1)
+        for year in years - 1:
+            path = granule_file('MCD', year, 1, H, V)
+            if path is None:
+                continue
+            create_land_cover_granule(rng, path, patches)
+            n_granules += 1
+
+    return n_granules, n_fires
+
+
+if __name__ == '__main__':
+
+    with Pool(args.processes) as pool:
+        n_granules, n_fires = np.sum(pool.map(main, tiles), axis=0)
+
+    print('stored {} granules ({} fire detections) in {}'.format(
+        n_granules, n_fires, cwd))
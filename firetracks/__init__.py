@@ -0,0 +1,7 @@
+
+# Copyright (C) 2021 by
+# Dominik Traxl <dominik.traxl@posteo.org>
+# All rights reserved.
+# MIT license.
+
+"""Helper modules shared by the numbered FireTracks scripts."""
@@ -0,0 +1,155 @@
+
+# Copyright (C) 2021 by
+# Dominik Traxl <dominik.traxl@posteo.org>
+# All rights reserved.
+# MIT license.
+
+"""Vectorized group-by aggregations on sorted segments.
+
+Rows are sorted by their group key(s) once, after which every aggregation
+is a single `ufunc.reduceat` over the contiguous segments of equal keys.
+Sums and means of floats use the compensated summation of pandas instead,
+so that their results are identical to a `groupby`. Sums of integers are
+int64 (uint64 for unsigned integers), so that they cannot overflow.
+
+"""
+
+import numpy as np
+import pandas as pd
+
+
+class Segments(object):
+    """Contiguous segments of rows with equal keys.
+
+    Parameters
+    ----------
+    keys : list of array_like
+        Group keys, in order of priority. Rows are sorted stably, so rows of
+        a segment keep their original order.
+    order : array_like, optional
+        Precomputed sort order of the rows (see `coarsen`).
+
+    """
+
+    def __init__(self, keys, order=None):
+        keys = [np.asarray(key) for key in keys]
+        if order is None:
+            if len(keys) == 1:
+                order = np.argsort(keys[0], kind='stable')
+            else:
+                order = np.lexsort(keys[::-1])
+        self.order = order
+        self._keys = keys
+        n = len(self.order)
+
+        # segment boundaries
+        change = np.zeros(n, dtype=bool)
+        if n > 0:
+            change[0] = True
+        for key in keys:
+            key = key[self.order]
+            change[1:] |= key[1:] != key[:-1]
+        self.starts = np.flatnonzero(change)
+        self.ends = np.append(self.starts[1:], n)
+        self.sizes = self.ends - self.starts
+
+        # key values of each segment
+        self.keys = [key[self.order][self.starts] for key in keys]
+
+    def coarsen(self, n_keys=1):
+        """Segments of the first `n_keys` keys, sharing the sort order."""
+        return Segments(self._keys[:n_keys], order=self.order)
+
+    def __len__(self):
+        return len(self.starts)
+
+    def ids(self):
+        """Segment id of every (sorted) row."""
+        return np.repeat(np.arange(len(self)), self.sizes)
+
+    def first_occurrence(self, values, sort=True):
+        """Mask of the first occurrence of each value within each segment."""
+        values = np.asarray(values)
+        if sort:
+            values = values[self.order]
+        return ~pd.DataFrame({'s': self.ids(), 'v': values}).duplicated(
+            ).values
+
+    def reduce(self, values, func, sort=True):
+        """Reduce `values` over each segment.
+
+        `func` is one of 'min', 'max', 'sum', 'mean', 'first', 'last',
+        'size' or 'nunique'. Set `sort` to False if `values` are already in
+        sorted order.
+
+        """
+        values = np.asarray(values)
+        if sort:
+            values = values[self.order]
+
+        if func == 'size':
+            return self.sizes.copy()
+        elif func == 'first':
+            return values[self.starts]
+        elif func == 'last':
+            return values[self.ends - 1]
+        elif func == 'nunique':
+            first = self.first_occurrence(values, sort=False)
+            return np.add.reduceat(first.astype(np.int64), self.starts)
+
+        # datetimes are reduced as integers
+        dtype = values.dtype
+        if dtype.kind in 'mM':
+            values = values.view(np.int64)
+
+        if func == 'min':
+            result = np.minimum.reduceat(values, self.starts)
+        elif func == 'max':
+            result = np.maximum.reduceat(values, self.starts)
+        elif func in ('sum', 'mean') and dtype.kind == 'f':
+            # compensated summation of pandas, in the same order (rows of a
+            # segment keep their original order), so results are identical
+            grouped = pd.Series(values).groupby(self.ids(), sort=False)
+            return getattr(grouped, func)().values
+        elif func in ('sum', 'mean'):
+            # exact sums of integers, as int64/uint64 (pandas only casts
+            # back to the dtype of the values if the sums fit, i.e., the
+            # dtype would depend on the data)
+            if dtype.kind in 'bi':
+                result = np.add.reduceat(values.astype(np.int64), self.starts)
+            else:
+                result = np.add.reduceat(values.astype(np.uint64),
+                                         self.starts)
+            if func == 'mean':
+                return result / self.sizes
+            return result
+        else:
+            raise ValueError('unknown aggregation function: {}'.format(func))
+
+        if dtype.kind in 'mM':
+            result = result.view(dtype)
+
+        return result
+
+    def aggregate(self, df, feature_funcs, names=None):
+        """Aggregate the columns of `df` according to `feature_funcs`.
+
+        Produces the same table as `deepgraph.DeepGraph.partition_nodes`: the
+        number of rows per segment ('n_nodes'), followed by a column
+        '<feature>_<func>' for each function applied to each feature. The
+        index holds the key values of each segment, named `names`.
+
+        """
+        table = {'n_nodes': self.sizes.copy()}
+        for feature, funcs in feature_funcs.items():
+            values = df[feature].values[self.order]
+            for func in funcs:
+                table['{}_{}'.format(feature, func)] = self.reduce(
+                    values, func, sort=False)
+
+        if len(self.keys) == 1:
+            index = pd.Index(self.keys[0], name=names and names[0])
+        else:
+            index = pd.MultiIndex.from_arrays(self.keys, names=names)
+
+        return pd.DataFrame(table, index=index)
@@ -0,0 +1,330 @@
+
+# Copyright (C) 2021 by
+# Dominik Traxl <dominik.traxl@posteo.org>
+# All rights reserved.
+# MIT license.
+
+"""Component labelling of fire events (union-find, incremental state)."""
+
+import os
+
+import numpy as np
+import pandas as pd
+
+# component state file (see 04_find_connected_fire_events.py --append)
+state_file = 'cp_state.pickle'
+
+
+class UnionFind(object):
+    """Array based union-find.
+
+    Unions are applied in bulk on arrays of node pairs. The larger root is
+    always hooked onto the smaller one, so the root of every set is its
+    smallest member.
+
+    """
+
+    def __init__(self, n):
+        self.parent = np.arange(n, dtype=np.int64)
+
+    def find(self, nodes):
+        """Return the roots of `nodes` (compressing their paths).
+
+        Paths are halved while they are traversed (every visited node is
+        pointed to its grandparent), so that the steps along long chains
+        double with each iteration.
+
+        """
+        parent = self.parent
+        roots = parent[nodes]
+        while True:
+            grand = parent[roots]
+            if (grand == roots).all():
+                break
+            parent[roots] = parent[grand]
+            roots = grand
+        parent[nodes] = roots
+        return roots
+
+    def union(self, s, t):
+        """Merge the sets of all node pairs (s[k], t[k])."""
+        s = np.asarray(s, dtype=np.int64)
+        t = np.asarray(t, dtype=np.int64)
+        while len(s) > 0:
+            rs = self.find(s)
+            rt = self.find(t)
+            m = rs != rt
+            if not m.any():
+                break
+            s = s[m]
+            t = t[m]
+            np.minimum.at(self.parent, np.maximum(rs[m], rt[m]),
+                          np.minimum(rs[m], rt[m]))
+
+    def labels(self):
+        """Return the root of every node."""
+        return self.find(np.arange(len(self.parent)))
+
+
+class DiskUnionFind(UnionFind):
+    """Union-find with its parent array memory mapped to a file.
+
+    Edges and nodes are processed in blocks of `block_size`, so that only
+    one block (and the pages of the parent array cached by the OS) is held
+    in memory.
+
+    """
+
+    def __init__(self, n, path, block_size):
+        self.block_size = int(block_size)
+        self.parent = np.lib.format.open_memmap(
+            path, mode='w+', dtype=np.int64, shape=(n,))
+        for start in range(0, n, self.block_size):
+            stop = min(start + self.block_size, n)
+            self.parent[start:stop] = np.arange(start, stop)
+
+    def union(self, s, t):
+        for start in range(0, len(s), self.block_size):
+            stop = start + self.block_size
+            super(DiskUnionFind, self).union(s[start:stop], t[start:stop])
+
+    def labels(self):
+        """Compress all paths in place, return the (memory mapped) roots."""
+        n = len(self.parent)
+        for start in range(0, n, self.block_size):
+            self.find(np.arange(start, min(start + self.block_size, n)))
+        self.parent.flush()
+        return self.parent
+
+
+def relabel_by_size(labels):
+    """Relabel components by size, the largest component gets label 0.
+
+    Ties are broken by the position of the first member of a component.
+
+    """
+    _, first, inverse, counts = np.unique(
+        labels, return_index=True, return_inverse=True, return_counts=True)
+    order = np.lexsort((first, -counts))
+    rank = np.empty(len(order), dtype=np.int64)
+    rank[order] = np.arange(len(order))
+    return rank[inverse.ravel()]
+
+
+def relabel_roots_by_size(roots, path, block_size):
+    """Out-of-core `relabel_by_size` of the roots of a union-find.
+
+    Since the root of a set is its smallest member, it is also the first
+    member of a component, so ties are broken as in `relabel_by_size`. Only
+    arrays over the components (not over all nodes) are held in memory.
+
+    """
+    n = len(roots)
+    labels = np.lib.format.open_memmap(
+        path, mode='w+', dtype=np.int64, shape=(n,))
+
+    # component sizes (counted at their roots)
+    for start in range(0, n, block_size):
+        uroots, counts = np.unique(
+            roots[start:start + block_size], return_counts=True)
+        labels[uroots] += counts
+    cps = np.concatenate([
+        start + np.flatnonzero(labels[start:start + block_size])
+        for start in range(0, n, block_size)])
+    sizes = labels[cps]
+
+    # rank of each component
+    order = np.lexsort((cps, -sizes))
+    rank = np.empty(len(order), dtype=np.int64)
+    rank[order] = np.arange(len(order))
+    del sizes, order
+
+    # relabel (in place of the sizes)
+    for start in range(0, n, block_size):
+        block = roots[start:start + block_size]
+        labels[start:start + block_size] = rank[np.searchsorted(cps, block)]
+    labels.flush()
+
+    return labels
+
+
+def neighbour_pairs(x, y, t, radius=1, gap=1):
+    """Pairs of events within `radius` grid cells and `gap` days.
+
+    Same neighbourhood as the edges of 03_connect_neighboring_fire_events.py,
+    computed by hash joins on shifted (x, y, t) coordinates. Meant for small
+    sets of events (e.g., appended events and the stored frontier).
+
+    """
+    cells = pd.DataFrame({
+        'x': np.asarray(x, dtype=np.int64),
+        'y': np.asarray(y, dtype=np.int64),
+        't': np.asarray(t, dtype=np.int64),
+        'idx': np.arange(len(x)),
+    })
+
+    ss = []
+    ts = []
+    for dt in range(gap + 1):
+        for dx in range(-radius, radius + 1):
+            for dy in range(-radius, radius + 1):
+                # each same-day pair only once, no self loops
+                if dt == 0 and (dx, dy) <= (0, 0):
+                    continue
+                shifted = cells.assign(
+                    x=cells['x'] + dx, y=cells['y'] + dy, t=cells['t'] + dt)
+                pairs = shifted.merge(
+                    cells, on=['x', 'y', 't'], suffixes=('_s', '_t'))
+                ss.append(pairs['idx_s'].values)
+                ts.append(pairs['idx_t'].values)
+
+    return np.concatenate(ss), np.concatenate(ts)
+
+
+def frontier(x, y, t, cp, gap=1):
+    """Events of the last `gap` days, the only ones new events can reach."""
+    frontier = pd.DataFrame({'x': x, 'y': y, 't': t, 'cp': cp})
+    if len(frontier) == 0:
+        return frontier
+    return frontier.loc[frontier['t'] > frontier['t'].max() - gap]
+
+
+def resolve(cps, remap):
+    """Map merged component labels onto their surviving label.
+
+    Merges are resolved transitively (a union-find over the labels of
+    `remap`), i.e., every label maps onto the smallest label it was merged
+    with, directly or through a chain of merges.
+
+    """
+    cps = np.asarray(cps)
+    if len(remap) == 0:
+        return cps
+
+    old = remap['cp_old'].values.astype(np.int64)
+    new = remap['cp_new'].values.astype(np.int64)
+    labels, inverse = np.unique(np.concatenate((old, new)),
+                                return_inverse=True)
+    uf = UnionFind(len(labels))
+    uf.union(inverse[:len(old)], inverse[len(old):])
+    surviving = labels[uf.labels()]
+
+    pos = np.searchsorted(labels, cps).clip(max=len(labels) - 1)
+    hit = labels[pos] == cps
+
+    cps = cps.copy()
+    cps[hit] = surviving[pos[hit]]
+
+    return cps
+
+
+def create_state(n, n_cps, x, y, t, cp, gap=1):
+    """Component state after labelling the first `n` fire events.
+
+    x, y, t and cp are the coordinates and labels of (at least) the events
+    of the last `gap` days.
+
+    """
+    return {
+        'n': n,
+        'n_cps': n_cps,
+        't_last': int(t.max()) if len(t) > 0 else -1,
+        'frontier': frontier(x, y, t, cp, gap),
+        'remap': pd.DataFrame({'cp_old': np.array([], dtype=np.int64),
+                               'cp_new': np.array([], dtype=np.int64)}),
+    }
+
+
+def connect_appended(state, x, y, t, radius=1, gap=1):
+    """Label appended fire events, connecting them to the stored frontier.
+
+    New events connected to the frontier inherit its component label. If
+    they connect several frontier components, these are merged into the
+    smallest label and the merge is recorded in state['remap']. All other
+    new components get fresh labels, in order of appearance.
+
+    Returns the component labels of the appended events and the updated
+    state.
+
+    """
+    x = np.asarray(x)
+    y = np.asarray(y)
+    t = np.asarray(t)
+    if len(t) == 0:
+        return np.array([], dtype=np.int64), state
+    if t.min() <= state['t_last']:
+        raise ValueError(
+            'appended fire events must be later than the last labelled '
+            'day (t={})'.format(state['t_last']))
+
+    # frontier events first, then appended events
+    fr = state['frontier']
+    nf = len(fr)
+    xs = np.concatenate((fr['x'].values, x))
+    ys = np.concatenate((fr['y'].values, y))
+    ts = np.concatenate((fr['t'].values, t))
+    fcps = fr['cp'].values.astype(np.int64)
+
+    # connect (frontier events of the same component are connected through
+    # earlier events)
+    uf = UnionFind(len(ts))
+    uf.union(*neighbour_pairs(xs, ys, ts, radius, gap))
+    order = np.argsort(fcps, kind='stable')
+    same = fcps[order[1:]] == fcps[order[:-1]]
+    uf.union(order[1:][same], order[:-1][same])
+    roots = uf.labels()
+
+    # smallest frontier label of each set
+    none = np.iinfo(np.int64).max
+    labels = np.full(len(ts), none, dtype=np.int64)
+    np.minimum.at(labels, roots[:nf], fcps)
+
+    # fresh labels for sets without frontier events
+    new_roots = roots[nf:]
+    fresh = new_roots[labels[new_roots] == none]
+    fresh, first = np.unique(fresh, return_index=True)
+    fresh = fresh[np.argsort(first)]
+    labels[fresh] = state['n_cps'] + np.arange(len(fresh))
+    cps = labels[new_roots]
+
+    # merged frontier components
+    surviving = labels[roots[:nf]]
+    merged = fcps != surviving
+    remap = pd.DataFrame({'cp_old': fcps[merged],
+                          'cp_new': surviving[merged]}).drop_duplicates()
+    old_remap = state['remap'].copy()
+    old_remap['cp_new'] = resolve(old_remap['cp_new'].values, remap)
+    remap = pd.concat((old_remap, remap), ignore_index=True)
+
+    # new frontier (old frontier events may still be within reach)
+    fr = pd.concat((
+        fr.assign(cp=surviving),
+        pd.DataFrame({'x': x, 'y': y, 't': t, 'cp': cps}),
+    ), ignore_index=True)
+
+    state = {
+        'n': state['n'] + len(t),
+        'n_cps': state['n_cps'] + len(fresh),
+        't_last': int(t.max()),
+        'frontier': frontier(fr['x'].values, fr['y'].values, fr['t'].values,
+                             fr['cp'].values, gap),
+        'remap': remap,
+    }
+
+    return cps, state
+
+
+def write_state(cwd, state):
+    pd.to_pickle(state, os.path.join(cwd, state_file))
+
+
+def read_state(cwd):
+    return pd.read_pickle(os.path.join(cwd, state_file))
+
+
+def read_remap(cwd):
+    """Merges of components recorded by appending fire events (if any)."""
+    if not os.path.isfile(os.path.join(cwd, state_file)):
+        return pd.DataFrame({'cp_old': np.array([], dtype=np.int64),
+                             'cp_new': np.array([], dtype=np.int64)})
+    return read_state(cwd)['remap']
@@ -0,0 +1,144 @@
+
+# Copyright (C) 2021 by
+# Dominik Traxl <dominik.traxl@posteo.org>
+# All rights reserved.
+# MIT license.
+
+"""Run-length encoded footprints of components on the global 1-km grid.
+
+The cells of each component and day are encoded as runs of consecutive
+linear grid indices `lin = y*43200 + x` (see 01_create_fire_event_table.py
+for x and y), stored as records (t, start, length) in a binary file. An
+index of byte offsets per component allows reading the runs of any
+component without touching the fire event table.
+
+"""
+
+import os
+
+import numpy as np
+
+# width of the global 1-km grid (36 MODIS tiles of 1200 cells)
+n_x = 36 * 1200
+
+# run records
+record = np.dtype([('t', '<u2'), ('start', '<u4'), ('length', '<u2')])
+
+# files
+records_file = 'cp_fp.bin'
+index_file = 'cp_fp_idx.npy'
+
+
+def encode(cp, t, x, y, n_cps):
+    """Encode the cells of each component and day as runs.
+
+    Returns the run records, sorted by component, day and start, and the
+    byte offsets of the records of each component (n_cps + 1 values).
+
+    """
+    cp = np.asarray(cp, dtype=np.int64)
+    t = np.asarray(t, dtype=np.int64)
+    lin = np.asarray(y, dtype=np.int64) * n_x + np.asarray(x)
+
+    # sort by component, day and cell
+    order = np.lexsort((lin, t, cp))
+    cp, t, lin = cp[order], t[order], lin[order]
+
+    # unique cells of each component and day
+    new = np.ones(len(lin), dtype=bool)
+    new[1:] = (cp[1:] != cp[:-1]) | (t[1:] != t[:-1]) | (lin[1:] != lin[:-1])
+    cp, t, lin = cp[new], t[new], lin[new]
+
+    # runs of consecutive cells
+    starts = np.ones(len(lin), dtype=bool)
+    starts[1:] = (cp[1:] != cp[:-1]) | (t[1:] != t[:-1]) | \
+        (lin[1:] != lin[:-1] + 1)
+    starts = np.flatnonzero(starts)
+
+    runs = np.empty(len(starts), dtype=record)
+    runs['t'] = t[starts]
+    runs['start'] = lin[starts]
+    runs['length'] = np.diff(np.append(starts, len(lin)))
+
+    # byte offsets of each component
+    counts = np.bincount(cp[starts], minlength=n_cps)
+    offsets = np.zeros(n_cps + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum(counts) * record.itemsize
+
+    return runs, offsets
+
+
+def write(cwd, runs, offsets):
+    """Store run records and their index."""
+    runs.tofile(os.path.join(cwd, records_file))
+    np.save(os.path.join(cwd, index_file), offsets)
+
+
+def decode(runs):
+    """Linear grid indices of the cells of run records."""
+    lengths = runs['length'].astype(np.int64)
+    firsts = np.cumsum(lengths) - lengths
+    return (np.repeat(runs['start'].astype(np.int64) - firsts, lengths) +
+            np.arange(lengths.sum()))
+
+
+class Footprints(object):
+    """Reader of the footprints stored by 05_create_fire_component_table.py.
+
+    The run records are memory mapped, so that reading the footprint of a
+    component only reads its own records.
+
+    """
+
+    def __init__(self, cwd):
+        self.offsets = np.load(os.path.join(cwd, index_file))
+        path = os.path.join(cwd, records_file)
+        if os.path.getsize(path) > 0:
+            self.records = np.memmap(path, dtype=record, mode='r')
+        else:
+            self.records = np.empty(0, dtype=record)
+
+    def runs(self, cp):
+        """Run records of component `cp` (sorted by day and start)."""
+        start, stop = self.offsets[cp:cp + 2] // record.itemsize
+        return np.asarray(self.records[start:stop])
+
+    def days(self, cp):
+        """Days (t) of component `cp`."""
+        return np.unique(self.runs(cp)['t'])
+
+    def cells(self, cp, t=None):
+        """Linear grid indices of the (unique) cells of component `cp`.
+
+        If `t` is given, only the cells of day `t`, else the cells of all
+        days (the footprint of the component).
+
+        """
+        runs = self.runs(cp)
+        if t is not None:
+            return decode(runs[runs['t'] == t])
+        return np.unique(decode(runs))
+
+    def mask(self, cp, t=None):
+        """Bitmap of the cells of component `cp` (see `cells`).
+
+        Returns the bitmap over the bounding box of the cells, and the
+        global y and x of its first cell. Without cells (e.g., on a day
+        the component did not burn), the bitmap is empty (shape (0, 0)),
+        with y and x 0.
+
+        """
+        y, x = np.divmod(self.cells(cp, t), n_x)
+        if len(y) == 0:
+            return np.zeros((0, 0), dtype=bool), 0, 0
+        y0 = y.min()
+        x0 = x.min()
+        mask = np.zeros((y.max() - y0 + 1, x.max() - x0 + 1), dtype=bool)
+        mask[y - y0, x - x0] = True
+
+        return mask, y0, x0
+
+    def overlap(self, cp1, cp2):
+        """Number of cells shared by the footprints of two components."""
+        return len(np.intersect1d(self.cells(cp1), self.cells(cp2),
+                                  assume_unique=True))
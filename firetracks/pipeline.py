@@ -0,0 +1,98 @@
+
+# Copyright (C) 2021 by
+# Dominik Traxl <dominik.traxl@posteo.org>
+# All rights reserved.
+# MIT license.
+
+"""Run the stages of the pipeline in one process.
+
+Each stage (a numbered script and its arguments) is run in-process, as if
+run from the command line. The tables written by a stage (`v`, `v_<LC>`,
+`cp`, the `cp` sidecar columns and the edges `e.pickle`) are still stored
+on disk, but are additionally kept in memory (see `storage.keep`), so that
+later stages do not reload them from disk. The worker pools of the stages
+are forked from this process, i.e., the whole pipeline runs in one process
+tree.
+
+`workflow.run` runs its stages with `run_stage` as well, either in forked
+processes or, with `in_memory=True`, in this process using `keep_tables`.
+
+Usage::
+
+    from firetracks import pipeline
+
+    pipeline.run([
+        ['01_create_fire_event_table.py'],
+        ['02_create_land_cover_table.py', 'LC_Type1'],
+        ['03_connect_neighboring_fire_events.py'],
+        ...
+    ])
+
+"""
+
+import os
+import sys
+import runpy
+import contextlib
+
+from firetracks import storage
+
+
+def default_memory_limit():
+    """Half of the physical memory [bytes]."""
+    return os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES') // 2
+
+
+def run_stage(cmd, cwd=None):
+    """Run a stage script with arguments, in-process.
+
+    The script is run in `cwd` (default: the current working directory).
+
+    """
+    script = cmd[0]
+    argv = sys.argv
+    sys.argv = list(cmd)
+    previous = os.getcwd()
+    if cwd is not None:
+        os.chdir(cwd)
+    try:
+        runpy.run_path(script, run_name='__main__')
+    finally:
+        sys.argv = argv
+        os.chdir(previous)
+
+
+@contextlib.contextmanager
+def keep_tables(memory_limit=None):
+    """Keep the tables written within the context in memory.
+
+    `memory_limit` is the max. bytes of tables kept in memory (default:
+    `default_memory_limit`), see `storage.keep`.
+
+    """
+    if memory_limit is None:
+        memory_limit = default_memory_limit()
+
+    storage.memory_limit = memory_limit
+    try:
+        yield
+    finally:
+        storage.memory_limit = None
+        storage.memory.clear()
+
+
+def run(cmds, memory_limit=None):
+    """Run stages in order, keeping their tables in memory.
+
+    Parameters
+    ----------
+    cmds : list
+        Stages to run, each a list of the script and its arguments.
+    memory_limit : int, optional
+        Max. bytes of tables kept in memory between stages (default:
+        `default_memory_limit`). Tables beyond the limit are read from disk.
+
+    """
+    with keep_tables(memory_limit):
+        for cmd in cmds:
+            run_stage(cmd)
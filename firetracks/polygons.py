@@ -0,0 +1,324 @@
+
+# Copyright (C) 2021 by
+# Dominik Traxl <dominik.traxl@posteo.org>
+# All rights reserved.
+# MIT license.
+
+"""(Multi)polygons of sets of cells of the MODIS sinusoidal grid.
+
+Instead of dissolving one square per cell, the cells are rasterized into a
+small local bitmap and the boundary rings (shells and holes) are traced
+directly along the cell edges. Area and perimeter follow from the cells and
+boundary edges, without reprojecting the polygons.
+
+"""
+
+import numpy as np
+from shapely.geometry import Point, Polygon, MultiPolygon
+
+# MODIS constants
+# the height and width of each MODIS tile in the projection plane [m]
+T = 1111950.5196666666
+# the western/eastern limit of the projection plane [m]
+xmin = -20015109.354
+xmax = 20015109.354
+# the northern/southern limit of the projection plane [m]
+ymax = 10007554.677
+ymin = -10007554.677
+# the actual size of a "1-km" MODIS sinusoidal grid cell (926.6254330 m)
+w = T/1200.
+# radius of the sphere of the sinusoidal projection [m]
+R = 6371007.181
+
+# MODIS sinusoidal projection
+crs = '+proj=sinu +R=6371007.181 +nadgrids=@null +wktext'
+
+# directions of boundary edges (row, col steps): west, east, south, north
+steps = np.array([[0, -1], [0, 1], [1, 0], [-1, 0]])
+
+# left turn of each direction (rows grow southwards)
+left = np.array([2, 3, 1, 0])
+
+# sides of a cell: offset of the neighbouring cell, start corner and
+# direction of the boundary edge, such that the cell is on its left
+sides = [
+    ((-1, 0), (0, 1), 0),  # top, heading west
+    ((1, 0), (1, 0), 1),   # bottom, heading east
+    ((0, -1), (0, 0), 2),  # left, heading south
+    ((0, 1), (1, 1), 3),   # right, heading north
+]
+
+# opposite side of each side (top/bottom, left/right)
+opposite = [1, 0, 3, 2]
+
+
+def rasterize(rows, cols):
+    """Local bitmap of cells (padded by one empty cell on each side).
+
+    Returns the bitmap and the global row/col of its first non-padding cell.
+    Duplicate cells are allowed.
+
+    """
+    rows = np.asarray(rows, dtype=np.int64)
+    cols = np.asarray(cols, dtype=np.int64)
+    r0 = rows.min()
+    c0 = cols.min()
+    mask = np.zeros((rows.max() - r0 + 3, cols.max() - c0 + 3), dtype=bool)
+    mask[rows - r0 + 1, cols - c0 + 1] = True
+
+    return mask, r0, c0
+
+
+def boundary_edges(mask):
+    """Directed boundary edges of the cells of a (padded) bitmap.
+
+    Edges run counter-clockwise around shells and clockwise around holes
+    (cells on their left). Returns the start vertices (row, col) in the
+    vertex lattice of the unpadded bitmap, and the directions (index into
+    `steps`) of the edges.
+
+    """
+    r, c = np.nonzero(mask)
+    a = []
+    b = []
+    d = []
+    for (dr, dc), (sr, sc), direction in sides:
+        m = ~mask[r + dr, c + dc]
+        a.append(r[m] - 1 + sr)
+        b.append(c[m] - 1 + sc)
+        d.append(np.full(m.sum(), direction))
+
+    return np.concatenate(a), np.concatenate(b), np.concatenate(d)
+
+
+def trace_rings(mask, a, b, d):
+    """Trace the boundary rings of the cells of a (padded) bitmap.
+
+    At pinch points (cells touching diagonally), the ring turns left, so
+    that cells touching at a corner only are kept apart. A ring passing a
+    pinch point twice is split there into simple rings (e.g., a shell and
+    a hole touching it at the pinch point). Collinear vertices are dropped.
+
+    Returns a list of rings, each a tuple of the vertex rows and cols (the
+    ring is closed implicitly). a, b and d are the boundary edges of the
+    bitmap (see `boundary_edges`).
+
+    """
+    n = len(d)
+
+    # vertex ids, edges sorted by start vertex
+    n_b = mask.shape[1]
+    start = a * n_b + b
+    order = np.argsort(start, kind='stable')
+    a, b, d, start = a[order], b[order], d[order], start[order]
+    end = (a + steps[d, 0]) * n_b + (b + steps[d, 1])
+
+    # successor of each edge (one outgoing edge, or two at pinch points)
+    succ = np.searchsorted(start, end)
+    second = np.minimum(succ + 1, n - 1)
+    pinch = (start[second] == end) & (second != succ)
+    succ[pinch & (d[succ] != left[d])] += 1
+
+    # corner vertices (change of direction)
+    pred = np.empty(n, dtype=np.int64)
+    pred[succ] = np.arange(n)
+    corner = d != d[pred]
+
+    # rings (cycles of successors)
+    visited = np.zeros(n, dtype=bool)
+    rings = []
+    for e0 in range(n):
+        if visited[e0]:
+            continue
+        ring = []
+        e = e0
+        while not visited[e]:
+            visited[e] = True
+            if corner[e]:
+                ring.append(e)
+            e = succ[e]
+        ring = np.array(ring)
+        for loop in split_ring(start[ring]):
+            rings.append((a[ring[loop]], b[ring[loop]]))
+
+    return rings
+
+
+def split_ring(vertices):
+    """Split a ring at repeated vertices into simple rings.
+
+    Returns the positions of the vertices of each simple ring.
+
+    """
+    if len(np.unique(vertices)) == len(vertices):
+        return [np.arange(len(vertices))]
+
+    # cut off a loop whenever its first vertex is reached again
+    loops = []
+    stack = []
+    positions = {}
+    for k, vertex in enumerate(vertices):
+        if vertex in positions:
+            i = positions[vertex]
+            loops.append(np.array(stack[i:]))
+            for j in stack[i:]:
+                del positions[vertices[j]]
+            del stack[i:]
+        positions[vertex] = len(stack)
+        stack.append(k)
+    loops.append(np.array(stack))
+
+    return loops
+
+
+def signed_area(ring_rows, ring_cols):
+    """Signed area of a ring in cells, positive for shells."""
+    x = ring_cols
+    y = -ring_rows
+    return .5 * (np.dot(x, np.roll(y, -1)) - np.dot(np.roll(x, -1), y))
+
+
+def perimeter(a, b, d, r0, c0):
+    """Length of boundary edges on the sphere [m].
+
+    Edges along rows are parallels of true length `w`. Edges along cols
+    (constant X) are stretched by sqrt(1 + (X tan(phi) / R)^2), evaluated at
+    their midpoints.
+
+    """
+    vertical = d >= 2
+    x = xmin + (c0 + b[vertical]) * w
+    phi = (ymax - (r0 + a[vertical] + .5 * steps[d[vertical], 0]) * w) / R
+    stretch = np.sqrt(1 + (x * np.tan(phi) / R)**2)
+
+    return w * ((~vertical).sum() + stretch.sum())
+
+
+def polygonize(mask, a, b, d, r0, c0):
+    """(Multi)polygon of the boundary edges of a (padded) bitmap.
+
+    The polygon is in the sinusoidal projection; r0 and c0 are the global
+    row/col of the bitmap (see `rasterize`). Holes are assigned to the
+    smallest shell containing them.
+
+    """
+    shells = []
+    holes = []
+    for ring_rows, ring_cols in trace_rings(mask, a, b, d):
+        area = signed_area(ring_rows, ring_cols)
+        coords = np.column_stack((xmin + (c0 + ring_cols) * w,
+                                  ymax - (r0 + ring_rows) * w))
+        if area > 0:
+            shells.append((area, ring_rows, ring_cols, coords))
+        else:
+            # centre of the hole cell to the right of the first edge
+            a0, b0 = ring_rows[0], ring_cols[0]
+            dr = np.sign(ring_rows[1] - a0)
+            dc = np.sign(ring_cols[1] - b0)
+            point = Point(b0 + .5 * dc - .5 * dr, -(a0 + .5 * dr + .5 * dc))
+            holes.append((point, coords))
+
+    # assign holes to the smallest shell containing them
+    shells.sort(key=lambda shell: shell[0])
+    shell_holes = [[] for _ in shells]
+    if holes:
+        lattice = [Polygon(np.column_stack((ring_cols, -ring_rows)))
+                   for _, ring_rows, ring_cols, _ in shells]
+        for point, coords in holes:
+            for k, poly in enumerate(lattice):
+                if poly.contains(point):
+                    shell_holes[k].append(coords)
+                    break
+
+    polys = [Polygon(coords, shell_holes[k])
+             for k, (_, _, _, coords) in enumerate(shells)]
+    if len(polys) == 1:
+        return polys[0]
+
+    return MultiPolygon(polys)
+
+
+def cells_to_polygon(rows, cols):
+    """(Multi)polygon, area and perimeter of a set of cells.
+
+    Parameters
+    ----------
+    rows, cols : array_like
+        Global rows (V*1200 + i) and cols (H*1200 + j) of the cells.
+
+    Returns
+    -------
+    geometry : Polygon or MultiPolygon
+        In the sinusoidal projection, see `polygonize`.
+    area : float
+        Area [km^2], the number of cells times w^2 (the sinusoidal
+        projection is equal-area).
+    perimeter : float
+        Perimeter [km], see `perimeter`.
+
+    """
+    mask, r0, c0 = rasterize(rows, cols)
+    a, b, d = boundary_edges(mask)
+
+    return (polygonize(mask, a, b, d, r0, c0),
+            mask.sum() * w**2 / 10**6,
+            perimeter(a, b, d, r0, c0) / 10**3)
+
+
+class Footprint(object):
+    """Footprint of a set of cells, grown incrementally (e.g., day by day).
+
+    The bitmap spans the bounding box of all cells to be added. Adding
+    cells only toggles the boundary edges of the added cells and their
+    neighbours, the footprint is never rebuilt from scratch.
+
+    Parameters
+    ----------
+    rows, cols : array_like
+        Global rows and cols of all cells to be added.
+
+    """
+
+    def __init__(self, rows, cols):
+        self.mask, self.r0, self.c0 = rasterize(rows, cols)
+        self.mask[:] = False
+        self.sides = np.zeros((len(sides),) + self.mask.shape, dtype=bool)
+        self.n_cells = 0
+
+    def add(self, rows, cols):
+        """Add cells (duplicates and cells already added are ignored)."""
+        r = np.asarray(rows, dtype=np.int64) - self.r0 + 1
+        c = np.asarray(cols, dtype=np.int64) - self.c0 + 1
+        new = ~self.mask[r, c]
+        r, c = np.divmod(
+            np.unique(r[new] * self.mask.shape[1] + c[new]),
+            self.mask.shape[1])
+        self.mask[r, c] = True
+        self.n_cells += len(r)
+
+        # toggle boundary edges
+        for k, ((dr, dc), _, _) in enumerate(sides):
+            filled = self.mask[r + dr, c + dc]
+            self.sides[k, r, c] = ~filled
+            self.sides[opposite[k], r[filled] + dr, c[filled] + dc] = False
+
+    def edges(self):
+        """Boundary edges of the footprint (see `boundary_edges`)."""
+        a = []
+        b = []
+        d = []
+        for k, (_, (sr, sc), direction) in enumerate(sides):
+            r, c = np.nonzero(self.sides[k])
+            a.append(r - 1 + sr)
+            b.append(c - 1 + sc)
+            d.append(np.full(len(r), direction))
+
+        return np.concatenate(a), np.concatenate(b), np.concatenate(d)
+
+    def to_polygon(self):
+        """(Multi)polygon, area and perimeter, see `cells_to_polygon`."""
+        a, b, d = self.edges()
+
+        return (polygonize(self.mask, a, b, d, self.r0, self.c0),
+                self.n_cells * w**2 / 10**6,
+                perimeter(a, b, d, self.r0, self.c0) / 10**3)
@@ -0,0 +1,109 @@
+
+# Copyright (C) 2021 by
+# Dominik Traxl <dominik.traxl@posteo.org>
+# All rights reserved.
+# MIT license.
+
+"""Typed arrays shared with the worker processes of a `multiprocessing.Pool`.
+
+The parent process publishes the columns needed by the workers once into
+shared memory blocks; the workers attach to them (zero-copy) in the pool
+initializer. Unlike module-level pandas objects inherited by `fork`, the
+shared blocks are never copied by reference counting, so the workers do not
+end up holding private copies of the data.
+
+Usage::
+
+    with shm.published({'x': x, 'y': y}) as spec:
+        with Pool(processes, initializer=shm.attach,
+                  initargs=(spec,)) as pool:
+            ...  # workers read shm.arrays['x']
+
+"""
+
+import contextlib
+from multiprocessing import shared_memory
+
+import numpy as np
+
+# arrays attached by the current process (see `attach`)
+arrays = {}
+
+# shared memory blocks attached by the current process
+_blocks = []
+
+
+def publish(columns):
+    """Copy arrays into shared memory blocks.
+
+    Parameters
+    ----------
+    columns : dict
+        Arrays to publish, by name.
+
+    Returns
+    -------
+    spec : dict
+        Block name, shape and dtype of each array, to `attach` them.
+    blocks : list
+        The shared memory blocks, to be `release`d by the parent process.
+
+    """
+    spec = {}
+    blocks = []
+    for name, values in columns.items():
+        values = np.ascontiguousarray(values)
+        block = shared_memory.SharedMemory(
+            create=True, size=max(values.nbytes, 1))
+        np.ndarray(values.shape, dtype=values.dtype,
+                   buffer=block.buf)[...] = values
+        spec[name] = (block.name, values.shape, values.dtype.str)
+        blocks.append(block)
+
+    return spec, blocks
+
+
+@contextlib.contextmanager
+def published(columns):
+    """Publish arrays within a context, see `publish`.
+
+    Yields the `spec` of the arrays. The shared memory blocks are released
+    on exit, also if an exception is raised.
+
+    """
+    spec, blocks = publish(columns)
+    del columns
+    try:
+        yield spec
+    finally:
+        release(blocks)
+
+
+def attach(spec):
+    """Attach to published arrays, available as `shm.arrays[name]`.
+
+    Meant as the initializer of a `multiprocessing.Pool`.
+
+    """
+    for name, (block_name, shape, dtype) in spec.items():
+        block = shared_memory.SharedMemory(name=block_name)
+        _blocks.append(block)
+        arrays[name] = np.ndarray(shape, dtype=np.dtype(dtype),
+                                  buffer=block.buf)
+
+
+def release(blocks):
+    """Free published shared memory blocks."""
+    for block in blocks:
+        block.close()
+        block.unlink()
+
+
+def row_ranges(keys, bounds):
+    """Row ranges of partitions of sorted `keys`.
+
+    Rows of partition k are `slice(ranges[k], ranges[k+1])`, holding the
+    keys in [bounds[k], bounds[k+1]).
+
+    """
+    return np.searchsorted(keys, bounds)
@@ -0,0 +1,240 @@
+
+# Copyright (C) 2021 by
+# Dominik Traxl <dominik.traxl@posteo.org>
+# All rights reserved.
+# MIT license.
+
+"""Derived per-row columns stored next to a table, aligned by row position.
+
+Derived columns of a table file (e.g., the component labels `cp` of `v.h5`)
+are stored as separate arrays in a sidecar file (`v_cols.h5`), instead of
+rewriting the whole table. Adding or appending a column only costs that
+column's I/O; `read_table` joins the requested sidecar columns lazily.
+Tables of all storage backends (see `storage`) have an HDF5 sidecar file.
+
+"""
+
+import os
+
+import numpy as np
+import pandas as pd
+import tables
+
+from firetracks import storage
+
+filters = tables.Filters(complevel=5, complib='blosc')
+
+# number of rows written at once (values may be memory mapped)
+block_size = 2**22
+
+
+def sidecar_file(table_file):
+    """Sidecar file of a table file, e.g., 'v.h5' -> 'v_cols.h5'."""
+    stem, ext = os.path.splitext(table_file)
+    return stem + '_cols.h5'
+
+
+def _memory_key(table_file, name):
+    return (os.path.abspath(sidecar_file(table_file)), name)
+
+
+def write_column(table_file, name, values):
+    """Store (or overwrite) the sidecar column `name`."""
+    values = np.asanyarray(values)
+
+    # keep in memory (except memory mapped columns of out-of-core runs)
+    if isinstance(values, np.memmap):
+        storage.memory.pop(_memory_key(table_file, name), None)
+    else:
+        storage.keep(_memory_key(table_file, name), values, values.nbytes)
+
+    with tables.open_file(sidecar_file(table_file), mode='a') as h5:
+        if '/' + name in h5:
+            h5.remove_node('/', name)
+        arr = h5.create_earray(
+            '/', name, atom=tables.Atom.from_dtype(values.dtype),
+            shape=(0,), filters=filters, expectedrows=max(len(values), 1))
+        for start in range(0, len(values), block_size):
+            arr.append(values[start:start + block_size])
+
+
+def append_column(table_file, name, values):
+    """Append rows to the sidecar column `name` (created if missing)."""
+    values = np.asarray(values)
+    if name not in list_columns(table_file):
+        write_column(table_file, name, values)
+        return
+    kept = storage.recall(_memory_key(table_file, name))
+    if kept is not None:
+        kept = np.concatenate((kept, values))
+        storage.keep(_memory_key(table_file, name), kept, kept.nbytes)
+    with tables.open_file(sidecar_file(table_file), mode='a') as h5:
+        h5.get_node('/', name).append(values)
+
+
+def remove_column(table_file, name):
+    """Remove the sidecar column `name` (if present)."""
+    storage.memory.pop(_memory_key(table_file, name), None)
+    if name not in list_columns(table_file):
+        return
+    with tables.open_file(sidecar_file(table_file), mode='a') as h5:
+        h5.remove_node('/', name)
+
+
+def list_columns(table_file):
+    """Names of the sidecar columns of a table file."""
+    if not os.path.isfile(sidecar_file(table_file)):
+        return []
+    with tables.open_file(sidecar_file(table_file), mode='r') as h5:
+        return [node.name for node in h5.list_nodes('/')]
+
+
+def nrows(table_file, name):
+    kept = storage.recall(_memory_key(table_file, name))
+    if kept is not None:
+        return len(kept)
+    with tables.open_file(sidecar_file(table_file), mode='r') as h5:
+        return h5.get_node('/', name).nrows
+
+
+def read_column(table_file, name, start=None, stop=None, coordinates=None):
+    """Read a sidecar column, either a row slice or given row coordinates."""
+    kept = storage.recall(_memory_key(table_file, name))
+    if kept is not None:
+        if coordinates is None:
+            return kept[start:stop].copy()
+        return kept[np.asarray(coordinates, dtype=np.int64)]
+    with tables.open_file(sidecar_file(table_file), mode='r') as h5:
+        arr = h5.get_node('/', name)
+        if coordinates is None:
+            return arr[start:stop]
+        coordinates = np.asarray(coordinates)
+        if len(coordinates) == 0:
+            return np.array([], dtype=arr.dtype)
+        # read the covering slice, then select
+        lo = coordinates.min()
+        return arr[lo:coordinates.max() + 1][coordinates - lo]
+
+
+def _kept(table_file):
+    """Whether a table is kept in memory (see `storage.keep`)."""
+    return storage.recall(os.path.abspath(table_file)) is not None
+
+
+def _key(store, key):
+    if key is None:
+        key = store.keys()[0]
+    return key.lstrip('/')
+
+
+def read_table(table_file, key=None, columns=None, where=None, start=None,
+               stop=None, isin=None):
+    """Read a table, joining its sidecar columns.
+
+    Works like `pd.read_hdf`; `columns` may contain both table and sidecar
+    columns, and only the requested sidecar columns are read. `isin` maps
+    sidecar columns to the values of the rows to select (in addition to
+    `where`), e.g. {'cp': [0, 1, 2]}. `where` queries require the 'hdf'
+    storage backend. Tables kept in memory (see `storage.keep`) are read
+    from there, unless queried by `where`.
+
+    """
+    side_all = list_columns(table_file)
+
+    hdf = storage.backend_of(table_file) == 'hdf' and not (
+        where is None and _kept(table_file))
+    if hdf:
+        store = pd.HDFStore(table_file, mode='r')
+        key = _key(store, key)
+        n = store.get_storer(key).nrows
+        store.close()
+    elif where is not None:
+        raise ValueError("'where' queries require the 'hdf' storage backend")
+    else:
+        n = storage.nrows(table_file)
+
+    if columns is None:
+        base = None
+        side = side_all
+    else:
+        base = [col for col in columns if col not in side_all]
+        side = [col for col in columns if col in side_all]
+
+    for col in set(side) | set(isin or {}):
+        if col not in side_all:
+            raise ValueError(
+                "no sidecar column '{}' of {}".format(col, table_file))
+        if nrows(table_file, col) != n:
+            raise ValueError(
+                "sidecar column '{}' is not aligned with {} ({} vs {} rows)"
+                .format(col, table_file, nrows(table_file, col), n))
+
+    # rows to read
+    coords = None
+    if where is not None:
+        store = pd.HDFStore(table_file, mode='r')
+        coords = np.array(store.select_as_coordinates(
+            key, where=where, start=start, stop=stop))
+        store.close()
+    elif isin:
+        coords = np.arange(n)[start:stop]
+    for col, values in (isin or {}).items():
+        coords = coords[np.isin(
+            read_column(table_file, col, coordinates=coords), values)]
+
+    # no rows selected (an empty `where` of read_hdf selects all rows)
+    if coords is not None and len(coords) == 0:
+        coords = None
+        start = stop = 0
+
+    # read table columns
+    if base is not None and len(base) == 0:
+        if coords is not None:
+            df = pd.DataFrame(index=coords)
+        else:
+            df = pd.DataFrame(index=pd.RangeIndex(n)[start:stop])
+    elif hdf:
+        if coords is not None:
+            # (pytables writes to the coordinates)
+            df = pd.read_hdf(table_file, key, where=np.array(coords),
+                             columns=base)
+        else:
+            df = pd.read_hdf(table_file, key, columns=base, start=start,
+                             stop=stop)
+    else:
+        df = storage.read_table(table_file, columns=base, start=start,
+                                stop=stop, coordinates=coords)
+
+    # join sidecar columns
+    for col in side:
+        if coords is not None:
+            df[col] = read_column(table_file, col, coordinates=coords)
+        else:
+            df[col] = read_column(table_file, col, start=start, stop=stop)
+
+    if columns is not None:
+        df = df[columns]
+
+    return df
+
+
+def iter_table(table_file, key=None, columns=None, where=None, isin=None,
+               chunksize=2**20):
+    """Iterate over a table in chunks, joining its sidecar columns.
+
+    Like `read_table`, but only one chunk is held in memory at a time. Each
+    chunk holds the (selected) rows of the next `chunksize` rows of the
+    table.
+
+    """
+    if storage.backend_of(table_file) == 'hdf' and not _kept(table_file):
+        store = pd.HDFStore(table_file, mode='r')
+        key = _key(store, key)
+        n = store.get_storer(key).nrows
+        store.close()
+    else:
+        n = storage.nrows(table_file)
+
+    for start in range(0, n, chunksize):
+        yield read_table(table_file, key=key, columns=columns, where=where,
+                         start=start, stop=start + chunksize, isin=isin)
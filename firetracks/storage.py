@@ -0,0 +1,332 @@
+
+# Copyright (C) 2021 by
+# Dominik Traxl <dominik.traxl@posteo.org>
+# All rights reserved.
+# MIT license.
+
+"""Storage backends of the fire event and component tables (`v`, `cp`,
+`cpt`).
+
+- 'hdf': PyTables table with data columns and indexes (`v.h5`)
+- 'parquet': Parquet file in row groups (`v.parquet`)
+- 'zarr': zarr group with one chunked array per column (`v.zarr`)
+
+All backends store the same logical schema. With 'parquet' and 'zarr',
+reading a subset of columns only reads the chunks of these columns. The
+backend of a table is selected when it is written (see the `--storage`
+flags of 01_create_fire_event_table.py and 05_create_fire_component_table
+.py); readers detect it by the file extension.
+
+When the stages run in one process (see `firetracks.pipeline`, and
+`firetracks.workflow` with `in_memory=True`), written
+tables are additionally kept in memory (up to `memory_limit` bytes), and
+later stages read them from there instead of from disk.
+
+"""
+
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+# file extension of each backend
+backends = {'hdf': '.h5', 'parquet': '.parquet', 'zarr': '.zarr'}
+
+# rows per row group / chunk
+chunk_size = 2**20
+
+# objects kept in memory between stages, by key: (object, bytes)
+memory = {}
+
+# max. bytes kept in memory, None to disable
+memory_limit = None
+
+
+def table_file(cwd, name, backend=None):
+    """File of table `name` ('v', 'cp' or 'cpt').
+
+    If `backend` is None, the file of the existing table is returned
+    (defaulting to 'hdf').
+
+    """
+    if backend is None:
+        backend = 'hdf'
+        for candidate, ext in backends.items():
+            if os.path.exists(os.path.join(cwd, name + ext)):
+                backend = candidate
+                break
+
+    return os.path.join(cwd, name + backends[backend])
+
+
+def backend_of(path):
+    """Backend of a table file, by its extension."""
+    ext = os.path.splitext(path)[1]
+    for backend, backend_ext in backends.items():
+        if ext == backend_ext:
+            return backend
+    raise ValueError('unknown table file extension: {}'.format(path))
+
+
+def _key(path):
+    return os.path.splitext(os.path.basename(path))[0]
+
+
+def _zarr():
+    """Import zarr (optional dependency, version 2 API)."""
+    import zarr
+    if int(zarr.__version__.split('.')[0]) >= 3:
+        raise ImportError('the zarr backend requires zarr<3, found zarr '
+                          '{}'.format(zarr.__version__))
+    return zarr
+
+
+def keep(key, obj, nbytes):
+    """Keep an object in memory, if enabled and within `memory_limit`."""
+    memory.pop(key, None)
+    if memory_limit is None:
+        return
+    used = sum(size for _, size in memory.values())
+    if used + nbytes <= memory_limit:
+        memory[key] = (obj, nbytes)
+
+
+def recall(key):
+    """Object kept in memory under `key`, or None."""
+    if key not in memory:
+        return None
+    return memory[key][0]
+
+
+def write_table(path, df, index_columns=()):
+    """Store a table, removing tables of the same name of other backends.
+
+    `index_columns` are indexed by the 'hdf' backend (other backends keep
+    min/max statistics per row group/chunk instead).
+
+    """
+    stem = os.path.splitext(path)[0]
+    for ext in backends.values():
+        other = stem + ext
+        if other != path and os.path.isdir(other):
+            shutil.rmtree(other)
+        elif other != path and os.path.isfile(other):
+            os.remove(other)
+
+    backend = backend_of(path)
+    key = _key(path)
+
+    if backend == 'hdf':
+        store = pd.HDFStore(path, mode='w')
+        store.append(key, df, format='t', data_columns=True, index=False)
+        if index_columns:
+            store.create_table_index(key, columns=list(index_columns),
+                                     kind='full')
+        store.close()
+
+    elif backend == 'parquet':
+        df.to_parquet(path, index=False, row_group_size=chunk_size)
+
+    elif backend == 'zarr':
+        # optional dependency
+        zarr = _zarr()
+        import numcodecs
+
+        group = zarr.open_group(path, mode='w')
+        for col in df.columns:
+            values = df[col].values
+            if df[col].dtype == object or \
+                    isinstance(df[col].dtype, pd.StringDtype):
+                # strings (missing values stored as '')
+                values = df[col].fillna('').astype(str).to_numpy(object)
+                group.array(col, values, dtype=object,
+                            object_codec=numcodecs.VLenUTF8(),
+                            chunks=(chunk_size,))
+            else:
+                group.array(col, values, chunks=(chunk_size,))
+        group.attrs['columns'] = [str(col) for col in df.columns]
+
+    # keep in memory (rows indexed by position, like the stored table)
+    if memory_limit is not None:
+        if not df.index.equals(pd.RangeIndex(len(df))):
+            df = df.reset_index(drop=True)
+        keep(os.path.abspath(path), df, df.memory_usage(deep=True).sum())
+
+
+def append_table(path, df, index_columns=()):
+    """Append rows (with the same columns) to a table.
+
+    With 'hdf', the rows are appended to the stored table (its indexes are
+    updated). The other backends, and 'hdf' tables whose string columns are
+    too narrow for the appended rows, are rewritten.
+
+    """
+    # rows indexed by position
+    n = nrows(path)
+    df = df.set_axis(pd.RangeIndex(n, n + len(df)))
+    memory.pop(os.path.abspath(path), None)
+
+    if backend_of(path) == 'hdf':
+        store = pd.HDFStore(path, mode='a')
+        try:
+            store.append(_key(path), df, format='t', data_columns=True,
+                         index=False)
+            return
+        except ValueError:
+            # strings longer than the stored ones
+            pass
+        finally:
+            store.close()
+
+    df = pd.concat((read_table(path), df), ignore_index=True)
+    write_table(path, df, index_columns)
+
+
+def nrows(path):
+    """Number of rows of a table."""
+    df = recall(os.path.abspath(path))
+    if df is not None:
+        return len(df)
+
+    backend = backend_of(path)
+
+    if backend == 'hdf':
+        store = pd.HDFStore(path, mode='r')
+        n = store.get_storer(_key(path)).nrows
+        store.close()
+        return n
+
+    elif backend == 'parquet':
+        import pyarrow.parquet as pq
+        return pq.ParquetFile(path).metadata.num_rows
+
+    elif backend == 'zarr':
+        zarr = _zarr()
+        group = zarr.open_group(path, mode='r')
+        return len(group[group.attrs['columns'][0]])
+
+
+def list_columns(path):
+    """Column names of a table."""
+    backend = backend_of(path)
+
+    if backend == 'hdf':
+        return list(pd.read_hdf(path, _key(path), stop=0).columns)
+
+    elif backend == 'parquet':
+        import pyarrow.parquet as pq
+        return pq.ParquetFile(path).schema_arrow.names
+
+    elif backend == 'zarr':
+        zarr = _zarr()
+        return list(zarr.open_group(path, mode='r').attrs['columns'])
+
+
+def read_table(path, columns=None, start=None, stop=None, coordinates=None):
+    """Read (a subset of columns of) a table.
+
+    Either a row slice (`start`, `stop`) or the rows at `coordinates` are
+    read. The index holds the row positions.
+
+    """
+    df = recall(os.path.abspath(path))
+    if df is not None:
+        if columns is None:
+            columns = list(df.columns)
+        if coordinates is not None:
+            rows = np.asarray(coordinates)
+        else:
+            rows = slice(start, stop)
+        return pd.DataFrame(
+            {col: df[col].values[rows].copy() for col in columns},
+            index=df.index[rows], columns=columns)
+
+    backend = backend_of(path)
+
+    if backend == 'hdf':
+        if coordinates is not None and len(coordinates) == 0:
+            # (an empty `where` selects all rows)
+            start = stop = 0
+        elif coordinates is not None:
+            # (pytables writes to the coordinates)
+            return pd.read_hdf(path, _key(path), where=np.array(coordinates),
+                               columns=columns)
+        return pd.read_hdf(path, _key(path), columns=columns, start=start,
+                           stop=stop)
+
+    if backend == 'parquet':
+        import pyarrow.parquet as pq
+        pf = pq.ParquetFile(path)
+        if coordinates is not None:
+            rows = np.asarray(coordinates, dtype=np.int64)
+        else:
+            rows = range(pf.metadata.num_rows)[start:stop]
+            rows = np.arange(rows.start, rows.stop)
+
+        # only read the row groups of the selected rows
+        sizes = np.array([pf.metadata.row_group(k).num_rows
+                          for k in range(pf.num_row_groups)], dtype=np.int64)
+        bounds = np.cumsum(sizes) - sizes
+        groups = np.searchsorted(bounds, rows, side='right') - 1
+        read = np.unique(groups)
+        if len(read) == 0:
+            table = pf.schema_arrow.empty_table()
+            if columns is not None:
+                table = table.select(columns)
+        else:
+            table = pf.read_row_groups(read, columns=columns)
+
+        # positions of the rows within the groups read
+        offsets = np.zeros(pf.num_row_groups, dtype=np.int64)
+        offsets[read] = np.cumsum(sizes[read]) - sizes[read]
+        df = table.to_pandas().iloc[offsets[groups] + rows - bounds[groups]]
+        if coordinates is not None:
+            df.index = pd.Index(rows)
+        else:
+            df.index = pd.RangeIndex(pf.metadata.num_rows)[start:stop]
+        return df
+
+    elif backend == 'zarr':
+        zarr = _zarr()
+        group = zarr.open_group(path, mode='r')
+        if columns is None:
+            columns = group.attrs['columns']
+        df = {}
+        for col in columns:
+            arr = group[col]
+            if coordinates is not None:
+                coords = np.asarray(coordinates)
+                if len(coords) == 0:
+                    values = arr[0:0]
+                else:
+                    # read the covering slice, then select
+                    lo = coords.min()
+                    values = arr[lo:coords.max() + 1][coords - lo]
+            else:
+                values = arr[start:stop]
+            if values.dtype == object:
+                # strings, in the default string dtype of pandas
+                values = pd.Series(values).replace('', np.nan).astype(
+                    pd.Series(['']).dtype).array
+            df[col] = values
+        if coordinates is not None:
+            index = pd.Index(np.asarray(coordinates))
+        else:
+            index = pd.RangeIndex(nrows(path))[start:stop]
+        return pd.DataFrame(df, index=index, columns=columns)
+
+
+def write_pickle(path, obj):
+    """Pickle a dataframe (e.g., the edges), keeping it in memory."""
+    obj.to_pickle(path)
+    if memory_limit is not None:
+        keep(os.path.abspath(path), obj, obj.memory_usage(deep=True).sum())
+
+
+def read_pickle(path):
+    """Unpickle a dataframe stored by `write_pickle`."""
+    obj = recall(os.path.abspath(path))
+    if obj is not None:
+        return obj
+    return pd.read_pickle(path)
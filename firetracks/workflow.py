@@ -0,0 +1,406 @@
+
+# Copyright (C) 2021 by
+# Dominik Traxl <dominik.traxl@posteo.org>
+# All rights reserved.
+# MIT license.
+
+"""Run the stages of the pipeline, re-running only stale stages.
+
+Each stage (a script and its arguments) declares its input and output files
+(or directories), relative to the working directory. A stage is stale if
+one of its outputs is missing, if its command changed, or if one of its
+inputs or outputs changed since its last successful run. Changes are
+detected by fingerprints of the files, either their mtime and size
+('mtime'), or their content hash ('hash'; hashes are only recomputed for
+files whose mtime or size changed). The fingerprints of the last successful
+run of each stage are stored in `state_file`.
+
+A stage starts as soon as the stages producing its inputs are done (and up
+to date). Independent stages (e.g., the stage-02 runs of different land
+cover types) run concurrently, each in a forked process (see
+`pipeline.run_stage`), within a budget of CPUs and memory. With
+`in_memory=True`, the stale stages run one after another in this process
+instead, keeping their tables in memory (see `pipeline.keep_tables`).
+
+Usage::
+
+    from firetracks import workflow
+
+    workflow.run(workflow.stages(), cpus=32, memory=64 * 10**9)
+
+"""
+
+import os
+import json
+import time
+import hashlib
+import contextlib
+import subprocess
+import multiprocessing as mp
+
+from firetracks import pipeline
+
+# fingerprints of the last successful run of each stage
+state_file = 'firetracks_state.json'
+
+# estimated peak memory of a stage, relative to the size of its inputs
+# (if not given explicitly)
+memory_factor = 4
+
+# seconds between checks of running stages
+poll_interval = .5
+
+# land cover types of MCD12Q1 (see 02_create_land_cover_table.py)
+lc_types = ['LC_Type1', 'LC_Type2', 'LC_Type3', 'LC_Type4', 'LC_Type5',
+            'LC_Prop1', 'LC_Prop2', 'LC_Prop3', 'LC_Prop1_Assessment',
+            'LC_Prop2_Assessment', 'LC_Prop3_Assessment', 'QC', 'LW']
+
+
+class Stage(object):
+    """A script with arguments, and its input and output files.
+
+    The script itself and the `firetracks` package are inputs of every
+    stage.
+
+    Parameters
+    ----------
+    cmd : list
+        The script and its arguments.
+    inputs, outputs : list
+        Files or directories read/written by the stage.
+    cpus : int
+        Number of processes of the stage, passed as '--processes' if
+        `processes` is True.
+    processes : bool
+        Whether the script accepts '--processes'.
+    memory : int, optional
+        Estimated peak memory [bytes], by default `memory_factor` times the
+        size of the inputs (when the stage starts).
+
+    """
+
+    def __init__(self, cmd, inputs=(), outputs=(), cpus=1, processes=False,
+                 memory=None):
+        self.cmd = list(cmd)
+        self.data = list(inputs)
+        self.inputs = [self.cmd[0], 'firetracks'] + self.data
+        self.outputs = list(outputs)
+        self.cpus = cpus
+        self.processes = processes
+        self.memory = memory
+
+    @property
+    def name(self):
+        return ' '.join(self.cmd)
+
+    def command(self):
+        """Script and arguments of the stage (see `pipeline.run_stage`)."""
+        cmd = list(self.cmd)
+        if self.processes:
+            cmd += ['--processes', str(self.cpus)]
+        return cmd
+
+    def estimate_memory(self, cwd):
+        """Estimated peak memory [bytes], see `memory`."""
+        if self.memory is not None:
+            return self.memory
+        size = 0
+        for path in self.data:
+            for f in _files(os.path.join(cwd, path)):
+                size += os.path.getsize(f)
+        return memory_factor * size
+
+
+def stages(cpus=None):
+    """Stages of the complete pipeline (see test_firetracks.py).
+
+    `cpus` (default: all) are shared by the stages running concurrently,
+    i.e., the stage-02 runs, and the stage-06 and stage-07 runs.
+
+    """
+    if cpus is None:
+        cpus = os.cpu_count()
+
+    v = ['v.h5', 'v_cols.h5', 'cp_state.pickle']
+    lc_types_06 = [lc_type for lc_type in lc_types
+                   if not lc_type.endswith('_Assessment')]
+
+    stages = [
+        Stage(['create_data_description_tables.py'],
+              outputs=[name + '.md' for name in
+                       ['v', 'v_lc', 'cp', 'cpt', 'cp_lc', 'cp_poly',
+                        'cpt_poly']]),
+        Stage(['01_create_fire_event_table.py'],
+              inputs=['MOD14A1', 'MYD14A1'],
+              outputs=['v.h5', 'mxd14a1_meta.pickle'],
+              cpus=cpus, processes=True),
+    ]
+    for lc_type in lc_types:
+        stages.append(
+            Stage(['02_create_land_cover_table.py', lc_type],
+                  inputs=['v.h5', 'MCD12Q1'],
+                  outputs=['v_{}.h5'.format(lc_type),
+                           'mcd12q1_meta_{}.pickle'.format(lc_type)],
+                  cpus=max(1, cpus // len(lc_types)), processes=True))
+    stages += [
+        Stage(['03_connect_neighboring_fire_events.py'],
+              inputs=['v.h5'], outputs=['e.pickle'],
+              cpus=cpus, processes=True),
+        Stage(['04_find_connected_fire_events.py'],
+              inputs=['v.h5', 'e.pickle'],
+              outputs=['v_cols.h5', 'cp_state.pickle']),
+        Stage(['05_create_fire_component_table.py'],
+              inputs=v, outputs=['cp.h5']),
+        # (all land cover types at once, loading v.h5 and cp.h5 only once)
+        Stage(['06_create_component_land_cover_table.py'] + lc_types_06,
+              inputs=v + ['cp.h5'] + ['v_{}.h5'.format(lc_type)
+                                      for lc_type in lc_types_06],
+              outputs=['cp_{}.h5'.format(lc_type) for lc_type in lc_types_06],
+              cpus=max(1, cpus // 3), processes=True),
+        Stage(['07_create_component_polygons.py'],
+              inputs=v + ['cp.h5'], outputs=['cp_poly.gpkg'],
+              cpus=max(1, cpus // 3), processes=True),
+        Stage(['07_create_component_polygons.py', '-s'],
+              inputs=v + ['cp.h5'], outputs=['cpt_poly.gpkg'],
+              cpus=max(1, cpus // 3), processes=True),
+    ]
+
+    return stages
+
+
+def _files(path):
+    """Files of a path (the file itself, or the files of a directory)."""
+    if os.path.isdir(path):
+        for root, dirs, files in os.walk(path):
+            dirs[:] = sorted(d for d in dirs if d != '__pycache__')
+            for f in sorted(files):
+                yield os.path.join(root, f)
+    elif os.path.isfile(path):
+        yield path
+
+
+def fingerprint(path, method='mtime', previous=None):
+    """Fingerprint of a file or directory, None if it does not exist.
+
+    Returns a dict with the digest of the mtimes and sizes ('stat') of its
+    files and, if `method` is 'hash', the digest of their contents ('hash').
+    The content hash of the `previous` fingerprint is reused if the mtimes
+    and sizes did not change.
+
+    """
+    if not os.path.exists(path):
+        return None
+
+    stat = hashlib.blake2b()
+    for f in _files(path):
+        st = os.stat(f)
+        stat.update('{}\0{}\0{}\n'.format(
+            os.path.relpath(f, path), st.st_mtime_ns, st.st_size).encode())
+    fp = {'stat': stat.hexdigest()}
+
+    if method == 'hash':
+        if previous is not None and previous.get('stat') == fp['stat'] and \
+                previous.get('hash') is not None:
+            fp['hash'] = previous['hash']
+        else:
+            content = hashlib.blake2b()
+            for f in _files(path):
+                content.update(os.path.relpath(f, path).encode() + b'\0')
+                with open(f, 'rb') as fh:
+                    for block in iter(lambda: fh.read(2**20), b''):
+                        content.update(block)
+            fp['hash'] = content.hexdigest()
+
+    return fp
+
+
+def _changed(old, new, method):
+    if old is None or new is None:
+        return old is not new
+    if method == 'hash':
+        return old.get('hash') != new['hash']
+    return old['stat'] != new['stat']
+
+
+def read_state(cwd):
+    path = os.path.join(cwd, state_file)
+    if not os.path.isfile(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def write_state(cwd, state):
+    path = os.path.join(cwd, state_file)
+    with open(path + '.tmp', 'w') as f:
+        json.dump(state, f, indent=1)
+    os.replace(path + '.tmp', path)
+
+
+def is_stale(stage, record, cwd, method='mtime'):
+    """Whether a stage has to be (re-)run, given the record of its last run."""
+    if record is None or record['cmd'] != stage.cmd:
+        return True
+    for path in stage.outputs:
+        if not os.path.exists(os.path.join(cwd, path)):
+            return True
+    for path in stage.inputs + stage.outputs:
+        old = record['files'].get(path)
+        new = fingerprint(os.path.join(cwd, path), method, old)
+        if _changed(old, new, method):
+            return True
+
+    return False
+
+
+def record(stage, cwd, method='mtime', previous=None):
+    """Record of a successful run of a stage (fingerprints of its files)."""
+    files = {}
+    for path in stage.inputs + stage.outputs:
+        old = previous['files'].get(path) if previous else None
+        files[path] = fingerprint(os.path.join(cwd, path), method, old)
+
+    return {'cmd': stage.cmd, 'files': files}
+
+
+def run_in_process(stage, cwd):
+    """Run a stage in this process, see `pipeline.run_stage`."""
+    try:
+        pipeline.run_stage(stage.command(), cwd)
+    except SystemExit as e:
+        if e.code is not None and e.code != 0:
+            code = e.code if isinstance(e.code, int) else 1
+            raise subprocess.CalledProcessError(code, stage.command())
+
+
+def run(stages, cpus=None, memory=None, method='mtime', force=False,
+        cwd=None, in_memory=False):
+    """Run the stale stages, concurrently within a CPU and memory budget.
+
+    Parameters
+    ----------
+    stages : list
+        `Stage`s, in an order compatible with their dependencies (a stage
+        depends on the stages producing its inputs).
+    cpus : int, optional
+        Max. number of processes of all running stages (default: all CPUs).
+    memory : int, optional
+        Max. estimated memory of all running stages [bytes] (default: half
+        of the physical memory). A stage exceeding the budget on its own
+        runs alone.
+    method : {'mtime', 'hash'}
+        Fingerprints of the files, see `fingerprint`.
+    force : bool
+        Re-run all stages.
+    cwd : str, optional
+        Working directory (default: the current one).
+    in_memory : bool
+        Run the stale stages one after another in this process, keeping
+        their tables in memory (up to `memory` bytes) for the later stages,
+        see `pipeline.keep_tables`.
+
+    Returns
+    -------
+    ran : list
+        Names of the stages that were run.
+
+    """
+    if cpus is None:
+        cpus = os.cpu_count()
+    if memory is None:
+        memory = pipeline.default_memory_limit()
+    if cwd is None:
+        cwd = os.getcwd()
+
+    state = read_state(cwd)
+
+    # dependencies (stages producing the inputs of each stage)
+    producers = {}
+    for stage in stages:
+        for path in stage.outputs:
+            producers[path] = stage.name
+    deps = {stage.name: {producers[path] for path in stage.inputs
+                         if producers.get(path, stage.name) != stage.name}
+            for stage in stages}
+
+    def finish(stage):
+        state[stage.name] = record(stage, cwd, method, state.get(stage.name))
+        write_state(cwd, state)
+        done.add(stage.name)
+        ran.append(stage.name)
+
+    pending = list(stages)
+    running = {}
+    done = set()
+    ran = []
+    if in_memory:
+        context = pipeline.keep_tables(memory)
+    else:
+        context = contextlib.nullcontext()
+    with context:
+        while pending or running:
+
+            # start ready stages (skipping up to date stages)
+            progress = True
+            while progress:
+                progress = False
+                for stage in list(pending):
+                    if not deps[stage.name] <= done:
+                        continue
+                    if not force and not is_stale(
+                            stage, state.get(stage.name), cwd, method):
+                        print('up to date: {}'.format(stage.name))
+                        pending.remove(stage)
+                        done.add(stage.name)
+                        progress = True
+                        continue
+                    if in_memory:
+                        print('running: {}'.format(stage.name))
+                        pending.remove(stage)
+                        run_in_process(stage, cwd)
+                        finish(stage)
+                        progress = True
+                        continue
+                    stage_memory = stage.estimate_memory(cwd)
+                    used_cpus = sum(s.cpus for s, _ in running.values())
+                    used_memory = sum(m for _, m in running.values())
+                    if running and (used_cpus + stage.cpus > cpus or
+                                    used_memory + stage_memory > memory):
+                        continue
+                    print('running: {}'.format(stage.name))
+                    proc = mp.get_context('fork').Process(
+                        target=pipeline.run_stage,
+                        args=(stage.command(), cwd))
+                    proc.start()
+                    running[proc] = (stage, stage_memory)
+                    pending.remove(stage)
+
+            if not running:
+                if pending:
+                    raise ValueError('unresolvable dependencies of {}'.format(
+                        [stage.name for stage in pending]))
+                break
+
+            # wait for running stages
+            time.sleep(poll_interval)
+            failed = None
+            for proc in list(running):
+                if proc.exitcode is None:
+                    continue
+                stage, _ = running.pop(proc)
+                if proc.exitcode != 0:
+                    failed = failed or (proc.exitcode, stage)
+                    continue
+                finish(stage)
+
+            # on failure, wait for (and record) the other running stages
+            if failed is not None:
+                for proc, (stage, _) in running.items():
+                    proc.join()
+                    if proc.exitcode == 0:
+                        finish(stage)
+                exitcode, stage = failed
+                raise subprocess.CalledProcessError(
+                    exitcode, stage.command())
+
+    return ran
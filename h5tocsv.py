@@ -46,10 +46,23 @@ Works with all HDF5 files of the FireTracks Scientific Dataset
 # MIT license.
 
 
+import io
+import os
+import re
+import bz2
+import gzip
+import lzma
+import shutil
+import zipfile
 import argparse
+import contextlib
+from multiprocessing import Pool
 
+import numpy as np
 import pandas as pd
 
+from firetracks import sidecar
+
 # argument parameters
 parser = argparse.ArgumentParser(
     description=__doc__,
@@ -58,8 +71,13 @@ parser = argparse.ArgumentParser(
 parser.add_argument(
     'input_file_name',
     metavar='input-file-name',
+    nargs='+',
     help="the input file to convert into csv "
-         "(including the file ending '.h5')",
+         "(including the file ending '.h5'). If several files are given, "
+         "they are joined to the first one (to which the time and row "
+         "filters apply): fire event tables ('v_<LC>.h5') by row, component "
+         "tables ('cp.h5', 'cp_<LC>.h5') by 'cp'. Columns of the same name "
+         "get the table name as suffix",
     type=str,
 )
 parser.add_argument(
@@ -67,7 +85,10 @@ parser.add_argument(
     metavar='output-file-name',
     help="the output file. "
          "Detects compression mode from the following file extensions: '.gz', "
-         "'.bz2', '.zip' or '.xz' (otherwise no compression)",
+         "'.bz2', '.zip' or '.xz' (otherwise no compression). "
+         "For the file extensions '.parquet', '.feather' or '.arrow', a "
+         "columnar dataset (directory) partitioned by year is written "
+         "instead of csv (requires pyarrow)",
     type=str,
 )
 parser.add_argument(
@@ -91,20 +112,356 @@ parser.add_argument(
          "Column names and their descriptions can be found here: "
          "https://github.com/dominiktraxl/firetracks",
     required=False)
+parser.add_argument(
+    '--bbox',
+    nargs=4,
+    metavar=('MIN_LON', 'MIN_LAT', 'MAX_LON', 'MAX_LAT'),
+    help="select only rows within the given bounding box (fire events by "
+         "'lat'/'lon', components by 'lat_mean'/'lon_mean')",
+    type=float,
+    required=False,
+)
+parser.add_argument(
+    '--tiles',
+    nargs='+',
+    metavar='H,V',
+    help="select only fire events of the given MODIS tiles, e.g. 8,5 9,5",
+    type=str,
+    required=False,
+)
+parser.add_argument(
+    '--country',
+    nargs='+',
+    help="select only components (or fire events of components) of the "
+         "given countries (column 'country' of cp.h5, e.g. 'Australia'). "
+         "For fire events, cp.h5 must be in the directory of the input file",
+    type=str,
+    required=False,
+)
+parser.add_argument(
+    '--cp',
+    nargs='+',
+    help="select only the given components (or their fire events)",
+    type=int,
+    required=False,
+)
+parser.add_argument(
+    '--min-conf',
+    help="select only fire events with at least the given confidence "
+         "(column 'conf', 7: low, 8: nominal, 9: high)",
+    type=int,
+    required=False,
+)
+parser.add_argument(
+    '--chunksize',
+    help="stream the table in chunks of this many rows, with constant memory "
+         "usage (default: load the whole selection at once)",
+    type=int,
+    required=False,
+)
+parser.add_argument(
+    '-p', '--processes',
+    help="number of processes exporting time partitions of the selection in "
+         "parallel. The parts are concatenated in order into the output file "
+         "(for '.zip', one file per part is kept, listed in order in "
+         "'<output-file-name without .zip>.manifest') (default: %(default)s)",
+    type=int,
+    default=1,
+)
+parser.add_argument(
+    '--partition-freq',
+    help="frequency of the time partitions (pandas offset alias, e.g. 'MS' "
+         "for months, 'YS' for years; legacy aliases such as 'AS' are "
+         "mapped to their current names) (default: %(default)s)",
+    type=str,
+    default='MS',
+)
 args = parser.parse_args()
 
+# time partition frequency, mapping legacy aliases (removed in pandas 3)
+legacy_freqs = {'AS': 'YS', 'A': 'YE', 'Y': 'YE', 'BAS': 'BYS', 'BA': 'BYE',
+                'M': 'ME', 'Q': 'QE', 'H': 'h', 'T': 'min'}
+multiple, alias = re.match(r'(\d*)(.*)$', args.partition_freq).groups()
+for freq in [args.partition_freq, multiple + legacy_freqs.get(alias, alias)]:
+    try:
+        pd.tseries.frequencies.to_offset(freq)
+    except ValueError:
+        continue
+    args.partition_freq = freq
+    break
+else:
+    parser.error("invalid --partition-freq {!r} (pandas offset alias, e.g. "
+                 "'MS' or 'YS')".format(args.partition_freq))
+
+# columnar output formats (see pyarrow.dataset.write_dataset)
+columnar = {'.parquet': 'parquet', '.feather': 'feather', '.arrow': 'ipc'}
+
+# input table, and tables to join
+input_file_name = args.input_file_name[0]
+join_file_names = args.input_file_name[1:]
+
 # event or component table?
-if args.input_file_name.startswith('v'):
+if input_file_name.startswith('v'):
     dtcol = 'dtime'
-elif args.input_file_name.startswith('cp'):
+elif input_file_name.startswith('cp'):
     dtcol = 'dtime_min'
 
-# load .h5 file
-df = pd.read_hdf(
-    args.input_file_name,
-    where=f'{dtcol} >= "{args.from_time}" & {dtcol} < "{args.to_time}"',
-    columns=args.columns,
-)
+# spatial and attribute filters: 'where' conditions on (indexed) data columns
+# of the table, and component labels of fire events (sidecar column 'cp')
+conditions = []
+isin = {}
+if args.bbox is not None:
+    min_lon, min_lat, max_lon, max_lat = args.bbox
+    lon, lat = ('lon', 'lat') if dtcol == 'dtime' else ('lon_mean', 'lat_mean')
+    conditions.append(f'{lon} >= {min_lon} & {lon} <= {max_lon} & '
+                      f'{lat} >= {min_lat} & {lat} <= {max_lat}')
+if args.tiles is not None:
+    tiles = [tile.split(',') for tile in args.tiles]
+    conditions.append('(' + ' | '.join(
+        f'(H == {int(H)} & V == {int(V)})' for H, V in tiles) + ')')
+if args.min_conf is not None:
+    conditions.append(f'conf >= {args.min_conf}')
+cps = None
+if args.country is not None:
+    if dtcol == 'dtime_min':
+        conditions.append(f'country = {args.country!r}')
+    else:
+        cp_file = os.path.join(os.path.dirname(input_file_name), 'cp.h5')
+        cps = pd.read_hdf(cp_file, where=f'country = {args.country!r}',
+                          columns=['cp'])['cp'].values
+if args.cp is not None:
+    cps = args.cp if cps is None else np.intersect1d(cps, args.cp)
+if cps is not None:
+    if dtcol == 'dtime_min':
+        conditions.append(f'cp = {[int(cp) for cp in cps]!r}')
+    else:
+        isin['cp'] = cps
+
+
+@contextlib.contextmanager
+def open_output(file_name):
+    """Text handle of the output file, compressed by its file extension."""
+    ext = os.path.splitext(file_name)[1]
+    archive = None
+    if ext == '.gz':
+        handle = gzip.open(file_name, 'wt', newline='')
+    elif ext == '.bz2':
+        handle = bz2.open(file_name, 'wt', newline='')
+    elif ext == '.xz':
+        handle = lzma.open(file_name, 'wt', newline='')
+    elif ext == '.zip':
+        archive = zipfile.ZipFile(file_name, 'w',
+                                  compression=zipfile.ZIP_DEFLATED)
+        handle = io.TextIOWrapper(
+            archive.open(os.path.basename(file_name)[:-len(ext)], 'w'),
+            newline='')
+    else:
+        handle = open(file_name, 'w', newline='')
+    try:
+        yield handle
+    finally:
+        handle.close()
+        if archive is not None:
+            archive.close()
+
+
+def write_columnar(df, dir_name, part):
+    """Append a chunk to a columnar dataset, partitioned by year."""
+    # optional dependency
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+
+    ext = os.path.splitext(dir_name)[1]
+
+    # partition column
+    df = df.reset_index()
+    df['year'] = df[dtcol].dt.year.astype('int32')
+    if args.columns is not None and dtcol not in args.columns:
+        df.drop(columns=dtcol, inplace=True)
+
+    # dictionary-encoded string columns
+    for col in df.columns[df.dtypes == object]:
+        df[col] = df[col].astype('category')
+
+    # one file per chunk and year (with row group statistics, for parquet)
+    ds.write_dataset(
+        pa.Table.from_pandas(df, preserve_index=False), dir_name,
+        format=columnar[ext], partitioning=['year'],
+        partitioning_flavor='hive',
+        basename_template='part-{}-{{i}}{}'.format(part, ext),
+        existing_data_behavior='overwrite_or_ignore')
+
+
+def table_columns(file_name):
+    """Columns, key and number of rows of the (first) table of a file."""
+    store = pd.HDFStore(file_name, mode='r')
+    key = store.keys()[0].lstrip('/')
+    n = store.get_storer(key).nrows
+    store.close()
+    return list(pd.read_hdf(file_name, key, stop=0).columns), key, n
+
+
+# tables joined to the input table: fire event tables aligned by row
+# (file name, key, columns, names), component tables indexed by 'cp'
+event_joins = []
+cp_joins = []
+input_cols, _, n = table_columns(input_file_name)
+input_cols += sidecar.list_columns(input_file_name)
+taken = list(input_cols)
+for file_name in join_file_names:
+    cols, key, n_rows = table_columns(file_name)
+    is_cp_table = os.path.basename(file_name).startswith('cp')
+    if not is_cp_table and n_rows != n:
+        raise ValueError('{} is not aligned with {} ({} vs {} rows)'.format(
+            file_name, input_file_name, n_rows, n))
+
+    # requested columns (time columns only once), renamed if taken
+    cols = [col for col in cols if
+            (args.columns is None or col in args.columns) and col != 'cp' and
+            not (col in ('dtime', 'dtime_min') and col in taken)]
+    names = {col: col + '_' + key if col in taken else col for col in cols}
+    taken += list(names.values())
+
+    if is_cp_table:
+        table = pd.read_hdf(file_name, key, columns=['cp'] + cols)
+        cp_joins.append(table.set_index('cp').rename(columns=names))
+    else:
+        event_joins.append((file_name, key, cols, names))
+
+# columns to load from the input table (component labels for the joins)
+if args.columns is None:
+    input_columns = None
+else:
+    input_columns = [col for col in args.columns if col in input_cols]
+    if cp_joins and 'cp' not in input_columns:
+        input_columns.append('cp')
+
+
+def join(df):
+    """Join the rows of the other input tables to a chunk of the input."""
+    coords = np.array(df.index)
+    for file_name, key, cols, names in event_joins:
+        if len(coords) > 0:
+            other = pd.read_hdf(file_name, key, where=coords, columns=cols)
+        else:
+            other = pd.read_hdf(file_name, key, columns=cols, stop=0)
+        for col in cols:
+            df[names[col]] = other[col].values
+    for table in cp_joins:
+        other = table.reindex(df['cp'].values)
+        for col in other.columns:
+            df[col] = other[col].values
+    if args.columns is not None and 'cp' not in args.columns and cp_joins:
+        del df['cp']
+    return df
+
+
+def export(part):
+    """Write the rows of a time partition to a (part) file.
+
+    Returns the file name and the number of rows written.
+
+    """
+    k, from_time, to_time, file_name, header = part
+    where = ' & '.join(
+        [f'{dtcol} >= "{from_time}" & {dtcol} < "{to_time}"'] + conditions)
+
+    # columns to load (columnar datasets are partitioned by time)
+    columns = input_columns
+    is_columnar = os.path.splitext(file_name)[1] in columnar
+    if is_columnar and columns is not None and dtcol not in columns:
+        columns = columns + [dtcol]
+
+    # load .h5 file (joining sidecar columns, e.g. 'cp' of 'v.h5'), either
+    # at once or chunk by chunk
+    if args.chunksize is None:
+        chunks = [sidecar.read_table(
+            input_file_name, where=where, columns=columns, isin=isin)]
+    else:
+        chunks = sidecar.iter_table(
+            input_file_name, where=where, columns=columns, isin=isin,
+            chunksize=args.chunksize)
+
+    # join other input tables
+    if join_file_names:
+        chunks = (join(df) for df in chunks)
+
+    # store as columnar dataset (skipping empty chunks)
+    n_rows = 0
+    if is_columnar:
+        for j, df in enumerate(chunks):
+            if len(df) > 0:
+                write_columnar(df, file_name, '{:05d}-{:05d}'.format(k, j))
+                n_rows += len(df)
+        return file_name, n_rows
+
+    # store as csv (skipping empty chunks, but writing the header)
+    with open_output(file_name) as handle:
+        first = True
+        for df in chunks:
+            if len(df) == 0 and not (header and first):
+                continue
+            df.to_csv(handle, header=header and first)
+            first = False
+            n_rows += len(df)
+
+    return file_name, n_rows
+
+
+if __name__ == '__main__':
+
+    # remove previous columnar dataset
+    stem, ext = os.path.splitext(args.output_file_name)
+    if ext in columnar and os.path.isdir(args.output_file_name):
+        shutil.rmtree(args.output_file_name)
+
+    if args.processes == 1:
+        export((0, args.from_time, args.to_time, args.output_file_name, True))
+
+    else:
+
+        # time partitions
+        bounds = pd.date_range(args.from_time, args.to_time,
+                               freq=args.partition_freq)
+        bounds = bounds.union(pd.DatetimeIndex([args.from_time,
+                                                args.to_time]))
+
+        # part files (compressed streams can be concatenated, zip files not,
+        # parts of columnar datasets are files of the same dataset)
+        if ext in columnar:
+            parts = [(k, bounds[k], bounds[k+1], args.output_file_name, True)
+                     for k in range(len(bounds) - 1)]
+        else:
+            parts = [(k, bounds[k], bounds[k+1],
+                      '{}.part{:05d}{}'.format(stem, k, ext),
+                      k == 0 or ext == '.zip')
+                     for k in range(len(bounds) - 1)]
+
+        # export time partitions in parallel
+        with Pool(args.processes) as pool:
+            n_rows = [n for _, n in pool.map(export, parts)]
+
+        # drop empty parts (but the first one, holding the header)
+        if ext not in columnar:
+            for k, part in enumerate(parts):
+                if n_rows[k] == 0 and (k > 0 or ext == '.zip'):
+                    os.remove(part[3])
+            parts = [part for k, part in enumerate(parts) if n_rows[k] > 0 or
+                     (k == 0 and ext != '.zip')]
+
+        if ext == '.zip':
+            # manifest of the (non-empty) parts, in order
+            manifest = pd.DataFrame({
+                'file': [os.path.basename(part[3]) for part in parts],
+                'from_time': [part[1] for part in parts],
+                'to_time': [part[2] for part in parts],
+            })
+            manifest.to_csv(stem + '.manifest', index=False)
 
-# store as csv
-df.to_csv(args.output_file_name)
+        elif ext not in columnar:
+            # concatenate parts in order
+            with open(args.output_file_name, 'wb') as dst:
+                for part in parts:
+                    with open(part[3], 'rb') as src:
+                        shutil.copyfileobj(src, dst)
+                    os.remove(part[3])
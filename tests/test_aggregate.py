@@ -0,0 +1,89 @@
+
+# Copyright (C) 2021 by
+# Dominik Traxl <dominik.traxl@posteo.org>
+# All rights reserved.
+# MIT license.
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from firetracks import aggregate
+
+# feature functions of 05_create_fire_component_table.py
+feature_funcs = {
+    't': ['min', 'max'],
+    'dtime': ['min', 'max'],
+    'lat': ['mean'],
+    'lon': ['mean'],
+    'maxFRP': ['mean', 'sum'],
+    'neigh_int': ['min'],
+}
+
+
+@pytest.fixture
+def v():
+    rng = np.random.default_rng(0)
+    n = 20000
+    t = np.sort(rng.integers(0, 400, n)).astype(np.uint16)
+    return pd.DataFrame({
+        't': t,
+        'dtime': pd.Timestamp('2002-01-01') + pd.to_timedelta(t, 'D'),
+        'lat': rng.uniform(-60, 70, n),
+        'lon': rng.uniform(-180, 180, n),
+        'maxFRP': rng.integers(0, 50000, n).astype(np.int32),
+        'neigh_int': rng.integers(3, 10, n).astype(np.uint8),
+        'gl': rng.integers(0, 5000, n).astype(np.uint32),
+        'cp': rng.zipf(1.5, n) % 3000,
+    })
+
+
+def test_aggregate_equals_deepgraph(v):
+    dg = pytest.importorskip('deepgraph')
+    expected = dg.DeepGraph(v).partition_nodes('cp', feature_funcs)
+
+    cp = aggregate.Segments([v['cp'].values]).aggregate(
+        v, feature_funcs, names=['cp'])
+
+    # (pandas casts sums back to int32 if they fit)
+    assert cp['maxFRP_sum'].dtype == np.int64
+    pd.testing.assert_frame_equal(
+        cp, expected.astype({'maxFRP_sum': np.int64}), check_exact=True,
+        check_index_type=False)
+
+
+def test_aggregate_equals_pandas(v):
+    funcs = {'dtime': ['first', 'last'], 'lat': ['mean', 'sum'],
+             'maxFRP': ['sum', 'max'], 'gl': ['nunique']}
+    expected = v.groupby(['cp', 't']).agg(funcs)
+    expected.columns = ['_'.join(col) for col in expected.columns]
+
+    days = aggregate.Segments([v['cp'].values, v['t'].values])
+    cpt = days.aggregate(v, funcs, names=['cp', 't'])
+    assert (cpt['n_nodes'].values == v.groupby(['cp', 't']).size()).all()
+
+    pd.testing.assert_frame_equal(
+        cpt.drop(columns='n_nodes'), expected.astype({'maxFRP_sum': np.int64}),
+        check_exact=True, check_index_type=False)
+
+
+@pytest.mark.parametrize('dtype', [np.int32, np.uint8])
+def test_integer_sums_do_not_overflow(dtype):
+    values = np.full(6, np.iinfo(dtype).max, dtype=dtype)
+    keys = np.array([0, 0, 0, 1, 2, 2])
+    expected = pd.Series(values).groupby(keys).sum().values
+    assert expected[0] > np.iinfo(dtype).max
+
+    sums = aggregate.Segments([keys]).reduce(values, 'sum')
+    assert sums.dtype == (np.int64 if dtype == np.int32 else np.uint64)
+    assert (sums == expected).all()
+    assert aggregate.Segments([keys]).reduce(values, 'max').dtype == dtype
+
+
+def test_coarsen_shares_order(v):
+    days = aggregate.Segments([v['cp'].values, v['t'].values])
+    seg = days.coarsen(1)
+    assert (seg.reduce(v['t'].values, 'max') ==
+            v.groupby('cp')['t'].max().values).all()
+    assert (seg.reduce(v['gl'].values, 'nunique') ==
+            v.groupby('cp')['gl'].nunique().values).all()
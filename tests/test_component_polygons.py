@@ -0,0 +1,93 @@
+
+# Copyright (C) 2021 by
+# Dominik Traxl <dominik.traxl@posteo.org>
+# All rights reserved.
+# MIT license.
+
+import os
+import sys
+import subprocess
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from firetracks import sidecar, storage
+
+gpd = pytest.importorskip('geopandas')
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture
+def cwd(tmp_path):
+    rng = np.random.default_rng(0)
+    n = 3000
+    cps = np.sort(rng.integers(0, 150, n))
+    v = pd.DataFrame({
+        'H': np.full(n, 20, dtype=np.uint8),
+        'V': np.full(n, 5, dtype=np.uint8),
+        'i': (cps // 15 * 20 + rng.integers(0, 6, n)).astype(np.uint16),
+        'j': (cps % 15 * 20 + rng.integers(0, 6, n)).astype(np.uint16),
+        't': (cps + rng.integers(0, 4, n)).astype(np.uint16),
+    })
+    storage.write_table(str(tmp_path / 'v.h5'), v)
+    sidecar.write_column(str(tmp_path / 'v.h5'), 'cp', cps)
+    cp = pd.DataFrame({
+        'cp': np.arange(150),
+        'dtime_min': pd.Timestamp('2002-12-01') +
+        pd.to_timedelta(np.arange(150), 'D'),
+    })
+    storage.write_table(str(tmp_path / 'cp.h5'), cp)
+    return tmp_path
+
+
+def run_07(cwd, *args, pythonpath=()):
+    env = dict(os.environ,
+               PYTHONPATH=os.pathsep.join(list(pythonpath) + [root]))
+    subprocess.check_call(
+        [sys.executable,
+         os.path.join(root, '07_create_component_polygons.py'),
+         '--processes', '2'] + list(args), cwd=cwd, env=env)
+
+
+def test_polygons(cwd):
+    run_07(cwd, '-f', 'gpkg', 'fgb')
+    gpkg = gpd.read_file(cwd / 'cp_poly.gpkg')
+    fgb = gpd.read_file(cwd / 'cp_poly.fgb')
+
+    assert list(gpkg['cp']) == list(range(150))
+    assert gpkg.geometry.is_valid.all()
+    assert gpkg.crs.to_epsg() == 4326
+
+    # (FlatGeobuf features are ordered by their spatial index)
+    fgb = fgb.sort_values('cp', ignore_index=True)
+    pd.testing.assert_frame_equal(
+        pd.DataFrame(gpkg.drop(columns='geometry')),
+        pd.DataFrame(fgb.drop(columns='geometry')), check_dtype=False)
+
+
+def test_geoparquet_without_fiona(cwd, tmp_path_factory):
+    if int(gpd.__version__.split('.')[0]) < 1:
+        pytest.skip('GeoParquet output requires geopandas>=1.0')
+
+    # fiona cannot be imported
+    blocked = tmp_path_factory.mktemp('blocked')
+    (blocked / 'fiona.py').write_text('raise ImportError("blocked")\n')
+    run_07(cwd, '-s', '-f', 'parquet', pythonpath=[str(blocked)])
+
+    cpt_poly = gpd.read_parquet(cwd / 'cpt_poly.parquet')
+    assert sorted(cpt_poly['year'].astype(int).unique()) == [2002, 2003]
+    assert cpt_poly.geometry.is_valid.all()
+    assert not os.path.exists(cwd / 'cpt_poly.gpkg')
+
+    # one file per year, sorted along a Hilbert curve, with a bbox covering
+    # column
+    pq = pytest.importorskip('pyarrow.parquet')
+    parts = sorted((cwd / 'cpt_poly.parquet').glob('year=*/*.parquet'))
+    assert [part.parent.name for part in parts] == ['year=2002', 'year=2003']
+    for part in parts:
+        assert 'bbox' in pq.read_schema(part).names
+        hilbert = gpd.read_parquet(part).geometry.hilbert_distance(
+            total_bounds=(-180, -90, 180, 90)).values
+        assert (hilbert[1:] >= hilbert[:-1]).all()
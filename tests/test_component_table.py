@@ -0,0 +1,70 @@
+
+# Copyright (C) 2021 by
+# Dominik Traxl <dominik.traxl@posteo.org>
+# All rights reserved.
+# MIT license.
+
+import os
+import sys
+import subprocess
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from firetracks import sidecar, storage
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture
+def cwd(tmp_path):
+    rng = np.random.default_rng(0)
+    n = 5000
+    t = np.sort(rng.integers(0, 100, n)).astype(np.uint16)
+    v = pd.DataFrame({
+        'x': rng.integers(0, 500, n).astype(np.uint16),
+        'y': rng.integers(0, 500, n).astype(np.uint16),
+        't': t,
+        'dtime': pd.Timestamp('2002-01-01') + pd.to_timedelta(t, 'D'),
+        'lat': rng.uniform(-60, 70, n),
+        'lon': rng.uniform(-180, 180, n),
+        'maxFRP': rng.integers(0, 50000, n).astype(np.int32),
+        'neigh_int': rng.integers(3, 10, n).astype(np.uint8),
+        'gl': rng.integers(0, 3000, n).astype(np.uint32),
+    })
+    storage.write_table(str(tmp_path / 'v.h5'), v)
+    sidecar.write_column(str(tmp_path / 'v.h5'), 'cp', rng.zipf(1.5, n) % 300)
+    return tmp_path
+
+
+def run_05(cwd, *args):
+    env = dict(os.environ, PYTHONPATH=root)
+    subprocess.check_call(
+        [sys.executable,
+         os.path.join(root, '05_create_fire_component_table.py')] +
+        list(args), cwd=cwd, env=env)
+
+
+@pytest.mark.parametrize('backend', ['hdf', 'parquet'])
+def test_time_series_table(cwd, backend):
+    run_05(cwd, '-t', '--storage', backend)
+    cp = storage.read_table(storage.table_file(str(cwd), 'cp'))
+    cpt = storage.read_table(storage.table_file(str(cwd), 'cpt'))
+    assert storage.backend_of(storage.table_file(str(cwd), 'cpt')) == backend
+
+    v = sidecar.read_table(str(cwd / 'v.h5'))
+    expected = v.groupby(['cp', 't']).agg(
+        {'lat': 'mean', 'maxFRP': ['sum', 'max']})
+    assert cpt['t'].dtype == np.uint16
+    assert cpt['maxFRP_sum'].dtype == cp['maxFRP_sum'].dtype == np.int64
+    assert len(cpt) == len(expected)
+
+    # sorted like cp, by time within each component
+    assert (cpt['cp'].drop_duplicates().values == cp['cp'].values).all()
+    cpt = cpt.set_index(['cp', 't']).sort_index()
+    assert (cpt['lat_mean'].values == expected[('lat', 'mean')].values).all()
+    assert (cpt['maxFRP_sum'].values ==
+            expected[('maxFRP', 'sum')].values).all()
+    assert (cpt.groupby(level='cp')['cum_gls'].last().values ==
+            cp.set_index('cp').sort_index()['unique_gls'].values).all()
@@ -0,0 +1,104 @@
+
+# Copyright (C) 2021 by
+# Dominik Traxl <dominik.traxl@posteo.org>
+# All rights reserved.
+# MIT license.
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from firetracks import components
+
+
+def label(x, y, t, radius=1, gap=1):
+    """Label all fire events at once."""
+    uf = components.UnionFind(len(t))
+    uf.union(*components.neighbour_pairs(x, y, t, radius, gap))
+    return components.relabel_by_size(uf.labels())
+
+
+def append_by_day(x, y, t, first_days, radius=1, gap=1):
+    """Label the events of the first days at once, append the rest daily."""
+    rows = t < first_days
+    cps = label(x[rows], y[rows], t[rows], radius, gap)
+    state = components.create_state(
+        rows.sum(), cps.max() + 1, x[rows], y[rows], t[rows], cps, gap)
+    cpss = [cps]
+    for day in range(first_days, t.max() + 1):
+        rows = t == day
+        cps, state = components.connect_appended(
+            state, x[rows], y[rows], t[rows], radius, gap)
+        cpss.append(cps)
+    return components.resolve(np.concatenate(cpss), state['remap']), state
+
+
+def assert_same_partition(a, b):
+    pairs = pd.DataFrame({'a': a, 'b': b}).drop_duplicates()
+    assert len(pairs) == len(np.unique(a)) == len(np.unique(b))
+
+
+def test_resolve_follows_chains():
+    remap = pd.DataFrame({'cp_old': [5, 3, 7], 'cp_new': [3, 1, 5]})
+    cps = components.resolve(np.array([7, 5, 3, 1, 2]), remap)
+    assert list(cps) == [1, 1, 1, 1, 2]
+
+
+def test_append_u_shaped_fire():
+    # day 0: the base of a U (small, cp 2), and two large fires (cp 0, 1);
+    # day 1: the tips of both arms of the U, both fires go on burning;
+    # day 2: the arms reach the fires, merging all three components
+    events = [(x, 0, 0) for x in range(10, 15)]
+    events += [(x, y, t) for x in range(0, 3) for y in range(6, 9)
+               for t in range(2)]
+    events += [(x, y, t) for x in range(22, 25) for y in range(6, 9)
+               for t in range(2)]
+    events += [(10, 1, 1), (14, 1, 1)]
+    events += [(9, y, 2) for y in range(2, 6)] + [(x, 6, 2)
+                                                   for x in range(3, 9)]
+    events += [(15, y, 2) for y in range(2, 6)] + [(x, 6, 2)
+                                                    for x in range(16, 22)]
+    x, y, t = np.array(events).T
+
+    cps, state = append_by_day(x, y, t, first_days=2)
+
+    assert_same_partition(cps, label(x, y, t))
+    assert (cps == 0).all()
+    remap = state['remap'].sort_values('cp_old')
+    assert remap.values.tolist() == [[1, 0], [2, 0]]
+
+
+@pytest.mark.parametrize('gap', [1, 3])
+def test_append_by_day_equals_batch(gap):
+    rng = np.random.default_rng(gap)
+    n = 3000
+    x = rng.integers(0, 40, n)
+    y = rng.integers(0, 40, n)
+    t = np.sort(rng.integers(0, 60, n))
+
+    cps, _ = append_by_day(x, y, t, first_days=gap, gap=gap)
+
+    assert_same_partition(cps, label(x, y, t, gap=gap))
+
+
+def test_union_find_chain():
+    n = 10**6
+    uf = components.UnionFind(n)
+    uf.union(np.arange(1, n), np.arange(n - 1))
+    assert (uf.labels() == 0).all()
+
+
+def test_disk_union_find_equals_union_find(tmp_path):
+    rng = np.random.default_rng(0)
+    n = 10000
+    s = rng.integers(0, n, n // 2)
+    t = rng.integers(0, n, n // 2)
+    uf = components.UnionFind(n)
+    uf.union(s, t)
+    duf = components.DiskUnionFind(n, str(tmp_path / 'uf.npy'), 500)
+    duf.union(s, t)
+    roots = duf.labels()
+    assert (roots == uf.labels()).all()
+    assert (components.relabel_roots_by_size(
+        roots, str(tmp_path / 'cp.npy'), 500) ==
+        components.relabel_by_size(uf.labels())).all()
@@ -0,0 +1,68 @@
+
+# Copyright (C) 2021 by
+# Dominik Traxl <dominik.traxl@posteo.org>
+# All rights reserved.
+# MIT license.
+
+import os
+import sys
+import subprocess
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from firetracks import sidecar, storage
+
+pytest.importorskip('deepgraph')
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def events(n, t0, seed):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        'x': rng.integers(0, 60, n).astype(np.uint16),
+        'y': rng.integers(0, 60, n).astype(np.uint16),
+        't': np.sort(rng.integers(t0, t0 + 50, n)).astype(np.uint16),
+    })
+
+
+@pytest.fixture
+def cwd(tmp_path):
+    storage.write_table(str(tmp_path / 'v.h5'), events(2000, 0, 0))
+    return tmp_path
+
+
+def run(cwd, script, *args):
+    env = dict(os.environ, PYTHONPATH=root)
+    subprocess.check_call(
+        [sys.executable, os.path.join(root, script)] + list(args), cwd=cwd,
+        env=env)
+
+
+def test_sweep_columns(cwd):
+    v_file = str(cwd / 'v.h5')
+    run(cwd, '03_connect_neighboring_fire_events.py', '--processes', '1',
+        '--max-radius', '2', '--max-gap', '2')
+    run(cwd, '04_find_connected_fire_events.py', '--radii', '1', '2')
+    assert sidecar.list_columns(v_file) == ['cp', 'cp_2_1']
+
+    # without a sweep, only cp is stored
+    run(cwd, '04_find_connected_fire_events.py')
+    assert sidecar.list_columns(v_file) == ['cp']
+
+
+def test_append_drops_sweep_columns(cwd):
+    v_file = str(cwd / 'v.h5')
+    run(cwd, '03_connect_neighboring_fire_events.py', '--processes', '1',
+        '--max-radius', '2')
+    run(cwd, '04_find_connected_fire_events.py', '--radii', '2')
+    assert sidecar.list_columns(v_file) == ['cp', 'cp_2_1']
+
+    storage.append_table(v_file, events(500, 50, 1))
+    with pytest.raises(subprocess.CalledProcessError):
+        run(cwd, '04_find_connected_fire_events.py', '--append', '-r', '2')
+    run(cwd, '04_find_connected_fire_events.py', '--append')
+    assert sidecar.list_columns(v_file) == ['cp']
+    assert len(sidecar.read_table(v_file)) == 2500
@@ -0,0 +1,68 @@
+
+# Copyright (C) 2021 by
+# Dominik Traxl <dominik.traxl@posteo.org>
+# All rights reserved.
+# MIT license.
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from firetracks import footprints
+
+
+@pytest.fixture
+def events():
+    rng = np.random.default_rng(0)
+    n = 5000
+    return pd.DataFrame({
+        'cp': rng.integers(0, 40, n),
+        't': rng.integers(0, 30, n),
+        'x': rng.integers(43150, 43200, n),
+        'y': rng.integers(2000, 2030, n),
+    })
+
+
+@pytest.fixture
+def fp(tmp_path, events):
+    # component 40 has no fire events
+    runs, offsets = footprints.encode(
+        events['cp'].values, events['t'].values, events['x'].values,
+        events['y'].values, 41)
+    footprints.write(str(tmp_path), runs, offsets)
+    return footprints.Footprints(str(tmp_path))
+
+
+def test_cells(fp, events):
+    for (cp, t), cells in events.groupby(['cp', 't']):
+        expected = np.unique(cells['y'].values * footprints.n_x +
+                             cells['x'].values)
+        assert (fp.cells(cp, t) == expected).all()
+    for cp, cells in events.groupby('cp'):
+        expected = np.unique(cells['y'].values * footprints.n_x +
+                             cells['x'].values)
+        assert (fp.cells(cp) == expected).all()
+        assert (fp.days(cp) == np.unique(cells['t'].values)).all()
+
+
+def test_mask(fp, events):
+    cells = events.loc[events['cp'] == 3]
+    mask, y0, x0 = fp.mask(3)
+    assert y0 == cells['y'].min()
+    assert x0 == cells['x'].min()
+    assert mask.sum() == len(cells.drop_duplicates(['x', 'y']))
+    assert mask[cells['y'].values - y0, cells['x'].values - x0].all()
+
+
+@pytest.mark.parametrize('cp, t', [(40, None), (3, 100)])
+def test_mask_without_cells(fp, cp, t):
+    mask, y0, x0 = fp.mask(cp, t)
+    assert mask.shape == (0, 0)
+    assert len(fp.cells(cp, t)) == 0
+
+
+def test_overlap(fp, events):
+    a = events.loc[events['cp'] == 1, ['x', 'y']].drop_duplicates()
+    b = events.loc[events['cp'] == 2, ['x', 'y']].drop_duplicates()
+    assert fp.overlap(1, 2) == len(a.merge(b))
+    assert fp.overlap(1, 40) == 0
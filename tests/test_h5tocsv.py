@@ -0,0 +1,121 @@
+
+# Copyright (C) 2021 by
+# Dominik Traxl <dominik.traxl@posteo.org>
+# All rights reserved.
+# MIT license.
+
+import os
+import sys
+import subprocess
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from firetracks import sidecar, storage
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture
+def cwd(tmp_path):
+    rng = np.random.default_rng(0)
+    n = 5000
+    v = pd.DataFrame({
+        'lat': rng.uniform(-40, 40, n),
+        'lon': rng.uniform(-180, 180, n),
+        'H': rng.integers(0, 36, n).astype(np.uint8),
+        'V': rng.integers(0, 18, n).astype(np.uint8),
+        'dtime': pd.date_range('2019-01-01', periods=n, freq='h'),
+        'conf': rng.integers(7, 10, n).astype(np.uint8),
+    })
+    storage.write_table(str(tmp_path / 'v.h5'), v,
+                        index_columns=['dtime', 'lat', 'lon', 'H', 'V',
+                                       'conf'])
+    cps = np.arange(n) // 10
+    sidecar.write_column(str(tmp_path / 'v.h5'), 'cp', cps)
+
+    cp = pd.DataFrame({
+        'cp': np.arange(cps.max() + 1),
+        'dtime_min': v['dtime'].values[::10],
+        'lat_mean': v['lat'].values[::10],
+        'lon_mean': v['lon'].values[::10],
+        'country': rng.choice(['Australia', 'Brazil'], cps.max() + 1),
+    })
+    storage.write_table(str(tmp_path / 'cp.h5'), cp,
+                        index_columns=['dtime_min', 'cp', 'country'])
+
+    return tmp_path
+
+
+def h5tocsv(cwd, *args):
+    env = dict(os.environ, PYTHONPATH=root)
+    subprocess.check_call(
+        [sys.executable, os.path.join(root, 'h5tocsv.py')] + list(args),
+        cwd=cwd, env=env)
+
+
+def read_csv(path):
+    return pd.read_csv(path, index_col=0)
+
+
+@pytest.mark.parametrize('input_file', ['v.h5', 'cp.h5'])
+def test_empty_selection(cwd, input_file):
+    h5tocsv(cwd, input_file, 'out.csv',
+            '--from-time', '2010-03-01', '--to-time', '2010-03-05')
+    assert len(read_csv(cwd / 'out.csv')) == 0
+
+
+@pytest.mark.parametrize('filters', [
+    ['--from-time', '2019-03-01', '--to-time', '2019-03-05'],
+    ['--min-conf', '9', '--bbox', '-90', '-20', '90', '20'],
+    ['--country', 'Brazil'],
+])
+def test_chunked_equals_unchunked(cwd, filters):
+    h5tocsv(cwd, 'v.h5', 'all.csv', *filters)
+    h5tocsv(cwd, 'v.h5', 'chunked.csv', '--chunksize', '500', *filters)
+    expected = read_csv(cwd / 'all.csv')
+    assert 0 < len(expected) < 5000
+    pd.testing.assert_frame_equal(read_csv(cwd / 'chunked.csv'), expected)
+
+
+@pytest.mark.parametrize('input_file', ['v.h5', 'cp.h5'])
+@pytest.mark.parametrize('ext', ['.csv', '.csv.gz'])
+def test_parallel_equals_serial(cwd, input_file, ext):
+    # time partitions before, within and after the data (empty partitions)
+    time = ['--from-time', '2018-11-01', '--to-time', '2019-10-01']
+    h5tocsv(cwd, input_file, 'serial' + ext, *time)
+    h5tocsv(cwd, input_file, 'parallel' + ext, '-p', '3', *time)
+    expected = read_csv(cwd / ('serial' + ext))
+    assert len(expected) > 0
+    pd.testing.assert_frame_equal(read_csv(cwd / ('parallel' + ext)),
+                                  expected)
+    assert not [f for f in os.listdir(cwd) if '.part' in f]
+
+
+def test_parallel_zip_parts(cwd):
+    time = ['--from-time', '2018-11-01', '--to-time', '2019-10-01',
+            '--min-conf', '8']
+    h5tocsv(cwd, 'v.h5', 'serial.csv', *time)
+    h5tocsv(cwd, 'v.h5', 'parallel.zip', '-p', '3', *time)
+    manifest = pd.read_csv(cwd / 'parallel.manifest')
+    parts = [read_csv(cwd / f) for f in manifest['file']]
+    assert all(len(part) > 0 for part in parts)
+    pd.testing.assert_frame_equal(pd.concat(parts),
+                                  read_csv(cwd / 'serial.csv'))
+
+
+@pytest.mark.parametrize('freq', ['QS', 'AS', '2AS'])
+def test_partition_freq(cwd, freq):
+    time = ['--from-time', '2018-11-01', '--to-time', '2019-10-01']
+    h5tocsv(cwd, 'v.h5', 'serial.csv', *time)
+    h5tocsv(cwd, 'v.h5', 'parallel.csv', '-p', '2', '--partition-freq', freq,
+            *time)
+    pd.testing.assert_frame_equal(read_csv(cwd / 'parallel.csv'),
+                                  read_csv(cwd / 'serial.csv'))
+
+
+def test_invalid_partition_freq(cwd):
+    with pytest.raises(subprocess.CalledProcessError):
+        h5tocsv(cwd, 'v.h5', 'out.csv', '--partition-freq', 'XS')
+    assert not os.path.exists(cwd / 'out.csv')
@@ -0,0 +1,47 @@
+
+# Copyright (C) 2021 by
+# Dominik Traxl <dominik.traxl@posteo.org>
+# All rights reserved.
+# MIT license.
+
+import os
+
+import pytest
+
+from firetracks import pipeline, storage
+
+# writes table t.h5, or reports whether it is kept in memory
+script = '''
+import os
+import sys
+import pandas as pd
+from firetracks import storage
+if sys.argv[1] == 'write':
+    storage.write_table('t.h5', pd.DataFrame({'x': [1, 2]}))
+else:
+    kept = storage.recall(os.path.abspath('t.h5')) is not None
+    open('kept.txt', 'w').write(str(kept))
+'''
+
+
+@pytest.fixture
+def cwd(tmp_path):
+    (tmp_path / 'stage.py').write_text(script)
+    return tmp_path
+
+
+def test_run_stage(cwd):
+    previous = os.getcwd()
+    pipeline.run_stage(['stage.py', 'write'], str(cwd))
+    assert os.getcwd() == previous
+    assert (cwd / 't.h5').exists()
+    assert storage.memory == {}
+
+
+def test_run(cwd, monkeypatch):
+    monkeypatch.chdir(cwd)
+    pipeline.run([['stage.py', 'write'], ['stage.py', 'read']],
+                 memory_limit=10**6)
+    assert (cwd / 'kept.txt').read_text() == 'True'
+    assert storage.memory_limit is None
+    assert storage.memory == {}
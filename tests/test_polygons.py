@@ -0,0 +1,103 @@
+
+# Copyright (C) 2021 by
+# Dominik Traxl <dominik.traxl@posteo.org>
+# All rights reserved.
+# MIT license.
+
+import numpy as np
+import pytest
+from shapely.geometry import box
+from shapely.ops import unary_union
+
+from firetracks import polygons
+
+# cells touching diagonally (pinch points)
+pinches = [
+    # shell touching its hole
+    [[1, 1, 1],
+     [1, 0, 1],
+     [0, 1, 1]],
+    # two holes touching each other
+    [[1, 1, 1, 1],
+     [1, 0, 1, 1],
+     [1, 1, 0, 1],
+     [1, 1, 1, 1]],
+    # two shells touching each other
+    [[1, 0],
+     [0, 1]],
+    # shell touching its hole twice, island within the hole
+    [[1, 1, 1, 1, 1],
+     [1, 0, 0, 0, 1],
+     [1, 0, 1, 0, 1],
+     [1, 0, 0, 0, 1],
+     [0, 1, 1, 1, 0]],
+]
+
+
+def dissolve(rows, cols):
+    """Union of one square per cell (the reference)."""
+    w = polygons.w
+    return unary_union([
+        box(polygons.xmin + c * w, polygons.ymax - (r + 1) * w,
+            polygons.xmin + (c + 1) * w, polygons.ymax - r * w)
+        for r, c in zip(rows, cols)])
+
+
+def assert_valid(geometry, rows, cols):
+    assert geometry.is_valid
+    reference = dissolve(rows, cols)
+    assert geometry.symmetric_difference(reference).area < 1e-3
+    assert len(geometry.interiors if geometry.geom_type == 'Polygon' else
+               [i for g in geometry.geoms for i in g.interiors]) == \
+        len(reference.interiors if reference.geom_type == 'Polygon' else
+            [i for g in reference.geoms for i in g.interiors])
+
+
+def random_masks(n, size):
+    rng = np.random.default_rng(0)
+    for _ in range(n):
+        mask = rng.random((size, size)) < rng.uniform(.3, .7)
+        if mask.any():
+            yield mask
+
+
+@pytest.mark.parametrize('mask', pinches + list(random_masks(200, 10)))
+def test_cells_to_polygon_is_valid(mask):
+    rows, cols = np.nonzero(mask)
+    rows = rows + 4800
+    cols = cols + 20000
+    geometry, area, _ = polygons.cells_to_polygon(rows, cols)
+
+    assert_valid(geometry, rows, cols)
+    assert np.isclose(area, len(rows) * polygons.w**2 / 10**6)
+
+
+@pytest.mark.parametrize('mask', pinches + list(random_masks(50, 10)))
+def test_footprint_is_valid(mask):
+    rows, cols = np.nonzero(mask)
+    footprint = polygons.Footprint(rows, cols)
+    for k in range(0, len(rows), 3):
+        footprint.add(rows[k:k + 3], cols[k:k + 3])
+        geometry, area, perimeter = footprint.to_polygon()
+
+        assert_valid(geometry, rows[:k + 3], cols[:k + 3])
+        expected = polygons.cells_to_polygon(rows[:k + 3], cols[:k + 3])
+        assert np.isclose(area, expected[1])
+        assert np.isclose(perimeter, expected[2])
+
+
+@pytest.mark.parametrize('row', [10800, 6360, 2400])
+def test_perimeter_is_length_on_sphere(row):
+    pyproj = pytest.importorskip('pyproj')
+    rows, cols = np.nonzero(np.ones((3, 4), dtype=bool))
+    rows = rows + row
+    cols = cols + 21000
+    geometry, _, perimeter = polygons.cells_to_polygon(rows, cols)
+
+    # geodesic length of the densified boundary on the sphere of the grid
+    ring = geometry.exterior.segmentize(polygons.w / 100)
+    lon, lat = pyproj.Transformer.from_crs(
+        polygons.crs, 'epsg:4326', always_xy=True).transform(*ring.xy)
+    geod = pyproj.Geod(a=polygons.R, b=polygons.R)
+    assert np.isclose(perimeter, geod.line_length(lon, lat) / 10**3,
+                      rtol=1e-4)
@@ -0,0 +1,52 @@
+
+# Copyright (C) 2021 by
+# Dominik Traxl <dominik.traxl@posteo.org>
+# All rights reserved.
+# MIT license.
+
+from multiprocessing import Pool, shared_memory
+
+import numpy as np
+import pytest
+
+from firetracks import shm
+
+
+def total(rows):
+    return int(shm.arrays['x'][rows].sum()), shm.arrays['y'].dtype.str
+
+
+def test_publish_attach():
+    x = np.arange(1000, dtype=np.int64)
+    y = np.zeros((0,), dtype=np.uint16)
+    spec, blocks = shm.publish({'x': x, 'y': y})
+    try:
+        bounds = np.array([0, 250, 600, 1000])
+        ranges = shm.row_ranges(x, bounds)
+        chunks = [slice(a, b) for a, b in zip(ranges[:-1], ranges[1:])]
+        with Pool(2, initializer=shm.attach, initargs=(spec,)) as pool:
+            result = pool.map(total, chunks)
+    finally:
+        shm.release(blocks)
+
+    assert [s for s, _ in result] == [x[c].sum() for c in chunks]
+    assert {dtype for _, dtype in result} == {y.dtype.str}
+
+
+def test_row_ranges():
+    keys = np.array([1, 1, 3, 4, 4, 4, 9])
+    assert list(shm.row_ranges(keys, [0, 2, 4, 10])) == [0, 2, 3, 7]
+
+
+def divide(i):
+    return 1 // int(shm.arrays['x'][i])
+
+
+def test_published_releases_on_error():
+    with pytest.raises(ZeroDivisionError):
+        with shm.published({'x': np.arange(10)}) as spec:
+            name = spec['x'][0]
+            with Pool(1, initializer=shm.attach, initargs=(spec,)) as pool:
+                pool.map(divide, [0])
+    with pytest.raises(FileNotFoundError):
+        shared_memory.SharedMemory(name=name)
@@ -0,0 +1,80 @@
+
+# Copyright (C) 2021 by
+# Dominik Traxl <dominik.traxl@posteo.org>
+# All rights reserved.
+# MIT license.
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from firetracks import pipeline, sidecar, storage
+
+
+@pytest.fixture
+def v_file(tmp_path):
+    n = 1000
+    v = pd.DataFrame({
+        'dtime': pd.date_range('2019-01-01', periods=n, freq='h'),
+        'lat': np.linspace(-10, 10, n),
+        'conf': np.arange(n, dtype=np.uint8) % 3 + 7,
+    })
+    path = str(tmp_path / 'v.h5')
+    storage.write_table(path, v, index_columns=['dtime', 'lat', 'conf'])
+    sidecar.write_column(path, 'cp', np.arange(n) // 10)
+    return path
+
+
+def test_read_table_joins_sidecar_columns(v_file):
+    df = sidecar.read_table(v_file, columns=['lat', 'cp'], start=5, stop=25)
+    assert list(df.columns) == ['lat', 'cp']
+    assert len(df) == 20
+    assert (df['cp'].values == np.arange(5, 25) // 10).all()
+
+
+@pytest.mark.parametrize('kwargs', [
+    {'where': 'dtime < "2018-01-01"'},
+    {'where': 'conf > 9'},
+    {'isin': {'cp': [-1]}},
+    {'where': 'lat > 0', 'start': 0, 'stop': 100},
+])
+def test_read_table_empty_selection(v_file, kwargs):
+    full = sidecar.read_table(v_file, columns=['dtime', 'lat', 'cp'])
+    df = sidecar.read_table(v_file, columns=['dtime', 'lat', 'cp'], **kwargs)
+    assert len(df) == 0
+    assert list(df.columns) == ['dtime', 'lat', 'cp']
+    assert (df.dtypes == full.dtypes).all()
+
+
+def test_iter_table_equals_read_table(v_file):
+    where = 'conf == 8 & lat > 5'
+    isin = {'cp': np.arange(80, 95)}
+    df = sidecar.read_table(v_file, where=where, isin=isin)
+    chunks = list(sidecar.iter_table(v_file, where=where, isin=isin,
+                                     chunksize=64))
+    assert len(chunks) == 16
+    pd.testing.assert_frame_equal(pd.concat(chunks), df)
+
+
+def test_read_kept_table(tmp_path, monkeypatch):
+    v = pd.DataFrame({'lat': np.linspace(-10, 10, 100),
+                      'conf': np.arange(100, dtype=np.uint8) % 3 + 7})
+    path = str(tmp_path / 'v.h5')
+    with pipeline.keep_tables(10**6):
+        storage.write_table(path, v)
+        sidecar.write_column(path, 'cp', np.arange(100) // 10)
+
+        # v.h5 is not opened
+        def blocked(*args, **kwargs):
+            raise AssertionError('v.h5 read from disk')
+        monkeypatch.setattr(pd, 'read_hdf', blocked)
+        monkeypatch.setattr(pd, 'HDFStore', blocked)
+
+        df = sidecar.read_table(path)
+        assert list(df.columns) == ['lat', 'conf', 'cp']
+        assert (df['lat'].values == v['lat'].values).all()
+        df = sidecar.read_table(path, columns=['cp', 'lat'], start=5, stop=25,
+                                isin={'cp': [1]})
+        assert list(df.index) == list(range(10, 20))
+        chunks = list(sidecar.iter_table(path, columns=['cp'], chunksize=30))
+        assert len(chunks) == 4
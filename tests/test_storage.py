@@ -0,0 +1,86 @@
+
+# Copyright (C) 2021 by
+# Dominik Traxl <dominik.traxl@posteo.org>
+# All rights reserved.
+# MIT license.
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from firetracks import storage
+
+
+def table(n, offset=0, country='Chad'):
+    return pd.DataFrame({
+        't': np.arange(offset, offset + n, dtype=np.uint16),
+        'lat': np.linspace(-10, 10, n),
+        'country': [country] * n,
+    })
+
+
+@pytest.mark.parametrize('backend', ['hdf', 'parquet'])
+@pytest.mark.parametrize('country', ['Mali', 'Burkina Faso'])
+def test_append_table(tmp_path, backend, country):
+    path = storage.table_file(str(tmp_path), 'v', backend)
+    storage.write_table(path, table(100), index_columns=['t'])
+    storage.append_table(path, table(50, 100, country), index_columns=['t'])
+
+    expected = pd.concat((table(100), table(50, 100, country)),
+                         ignore_index=True)
+    assert storage.nrows(path) == 150
+    pd.testing.assert_frame_equal(storage.read_table(path), expected,
+                                  check_index_type=False)
+    pd.testing.assert_frame_equal(
+        storage.read_table(path, start=120), expected.iloc[120:],
+        check_index_type=False)
+
+
+@pytest.fixture
+def chunk_size(monkeypatch):
+    monkeypatch.setattr(storage, 'chunk_size', 100)
+    return 100
+
+
+@pytest.mark.parametrize('backend', ['hdf', 'parquet', 'zarr'])
+@pytest.mark.parametrize('kwargs', [
+    {},
+    {'start': 250, 'stop': 420},
+    {'start': -30},
+    {'start': 100, 'stop': 100},
+    {'coordinates': [3, 4, 250, 251, 999]},
+    {'coordinates': []},
+])
+def test_read_table(tmp_path, chunk_size, backend, kwargs):
+    if backend == 'zarr':
+        pytest.importorskip('zarr')
+    path = storage.table_file(str(tmp_path), 'v', backend)
+    df = table(1000)
+    storage.write_table(path, df, index_columns=['t'])
+
+    if 'coordinates' in kwargs:
+        expected = df.iloc[kwargs['coordinates']]
+    else:
+        expected = df.iloc[kwargs.get('start'):kwargs.get('stop')]
+
+    result = storage.read_table(path, columns=['t', 'country'], **kwargs)
+    pd.testing.assert_frame_equal(result, expected[['t', 'country']],
+                                  check_index_type=False)
+
+
+def test_read_parquet_row_groups(tmp_path, chunk_size, monkeypatch):
+    pq = pytest.importorskip('pyarrow.parquet')
+    path = storage.table_file(str(tmp_path), 'v', 'parquet')
+    storage.write_table(path, table(1000))
+
+    read = []
+    read_row_groups = pq.ParquetFile.read_row_groups
+
+    def record(self, row_groups, *args, **kwargs):
+        read.append(list(row_groups))
+        return read_row_groups(self, row_groups, *args, **kwargs)
+
+    monkeypatch.setattr(pq.ParquetFile, 'read_row_groups', record)
+    storage.read_table(path, start=250, stop=420)
+    storage.read_table(path, coordinates=[3, 999])
+    assert read == [[2, 3, 4], [0, 9]]
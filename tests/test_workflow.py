@@ -0,0 +1,158 @@
+
+# Copyright (C) 2021 by
+# Dominik Traxl <dominik.traxl@posteo.org>
+# All rights reserved.
+# MIT license.
+
+import os
+import subprocess
+
+import pytest
+
+from firetracks import storage, workflow
+
+# appends its name and arguments to log.txt, and writes its outputs (the
+# arguments after '-o')
+script = '''
+import sys
+args = sys.argv[1:]
+with open('log.txt', 'a') as f:
+    f.write(' '.join([sys.argv[0]] + args) + '\\n')
+if 'fail' in args:
+    sys.exit(3)
+if 'sleep' in args:
+    import time
+    time.sleep(1)
+if 'table' in args:
+    import pandas as pd
+    from firetracks import storage
+    storage.write_table('t.h5', pd.DataFrame({'x': [1, 2]}))
+for path in args[args.index('-o') + 1:]:
+    with open(path, 'w') as f:
+        f.write(open('a.txt').read())
+'''
+
+
+def test_stages():
+    # the scripts run by test_firetracks.py before workflow.py (with one
+    # stage-06 run for all land cover types)
+    expected = [
+        'create_data_description_tables.py',
+        '01_create_fire_event_table.py',
+    ]
+    expected += ['02_create_land_cover_table.py ' + lc_type
+                 for lc_type in workflow.lc_types]
+    expected += [
+        '03_connect_neighboring_fire_events.py',
+        '04_find_connected_fire_events.py',
+        '05_create_fire_component_table.py',
+    ]
+    expected += [
+        '06_create_component_land_cover_table.py LC_Type1 LC_Type2 LC_Type3 '
+        'LC_Type4 LC_Type5 LC_Prop1 LC_Prop2 LC_Prop3 QC LW',
+        '07_create_component_polygons.py',
+        '07_create_component_polygons.py -s',
+    ]
+    stages = workflow.stages(cpus=26)
+    assert [stage.name for stage in stages] == expected
+
+    # every input is produced by an earlier stage (or is raw data)
+    produced = {'MOD14A1', 'MYD14A1', 'MCD12Q1'}
+    for stage in stages:
+        assert set(stage.data) <= produced
+        produced.update(stage.outputs)
+
+
+@pytest.fixture
+def cwd(tmp_path, monkeypatch):
+    monkeypatch.setattr(workflow, 'poll_interval', .01)
+    (tmp_path / 'stage.py').write_text(script)
+    (tmp_path / 'firetracks').mkdir()
+    (tmp_path / 'a.txt').write_text('a')
+    return tmp_path
+
+
+def dummy_stages(*extra):
+    return [
+        workflow.Stage(['stage.py', 'b', '-o', 'b.txt'],
+                       inputs=['a.txt'], outputs=['b.txt']),
+        workflow.Stage(['stage.py', 'c', '-o', 'c.txt'],
+                       inputs=['a.txt'], outputs=['c.txt']),
+        workflow.Stage(['stage.py', 'd'] + list(extra) + ['-o', 'd.txt'],
+                       inputs=['b.txt', 'c.txt'], outputs=['d.txt']),
+    ]
+
+
+def log(cwd):
+    return (cwd / 'log.txt').read_text().splitlines()
+
+
+@pytest.mark.parametrize('in_memory', [False, True])
+def test_run(cwd, in_memory):
+    stages = dummy_stages()
+    ran = workflow.run(stages, cpus=2, cwd=str(cwd), in_memory=in_memory)
+    assert ran[-1] == 'stage.py d -o d.txt'
+    assert sorted(ran) == sorted(stage.name for stage in stages)
+    assert (cwd / 'd.txt').read_text() == 'a'
+    assert len(log(cwd)) == 3
+
+    # up to date
+    assert workflow.run(stages, cwd=str(cwd)) == []
+    assert workflow.run(stages, cwd=str(cwd), method='hash') != []
+    assert workflow.run(stages, cwd=str(cwd), method='hash') == []
+
+    # changed command
+    assert workflow.run(dummy_stages('x'), cwd=str(cwd)) == [
+        'stage.py d x -o d.txt']
+
+    # changed input
+    os.utime(cwd / 'a.txt', ns=(0, 0))
+    assert len(workflow.run(dummy_stages('x'), cwd=str(cwd))) == 3
+
+    # changed output
+    (cwd / 'c.txt').write_text('c')
+    assert workflow.run(dummy_stages('x'), cwd=str(cwd)) == [
+        'stage.py c -o c.txt', 'stage.py d x -o d.txt']
+
+    # the working directory of the caller is unchanged
+    assert os.getcwd() != str(cwd)
+
+
+@pytest.mark.parametrize('in_memory', [False, True])
+def test_run_failure(cwd, in_memory):
+    with pytest.raises(subprocess.CalledProcessError) as e:
+        workflow.run(dummy_stages('fail'), cwd=str(cwd), in_memory=in_memory)
+    assert e.value.returncode == 3
+    assert not (cwd / 'd.txt').exists()
+
+    # the successful stages are not re-run
+    assert workflow.run(dummy_stages(), cwd=str(cwd)) == [
+        'stage.py d -o d.txt']
+
+
+def test_run_in_memory(cwd, monkeypatch):
+    kept = []
+    monkeypatch.setattr(storage, 'keep', lambda key, obj, nbytes:
+                        kept.append((key, storage.memory_limit)))
+    workflow.run(dummy_stages('table'), cwd=str(cwd), memory=10**6,
+                 in_memory=True)
+    assert kept == [(str(cwd / 't.h5'), 10**6)]
+    assert storage.memory_limit is None
+
+
+def test_run_failure_records_concurrent_stages(cwd):
+    stages = [
+        workflow.Stage(['stage.py', 'b', 'fail', '-o', 'b.txt'],
+                       inputs=['a.txt'], outputs=['b.txt']),
+        workflow.Stage(['stage.py', 'c', 'sleep', '-o', 'c.txt'],
+                       inputs=['a.txt'], outputs=['c.txt']),
+    ]
+    with pytest.raises(subprocess.CalledProcessError):
+        workflow.run(stages, cpus=2, cwd=str(cwd))
+    assert (cwd / 'c.txt').exists()
+    assert 'stage.py c sleep -o c.txt' in workflow.read_state(str(cwd))
+
+    # the concurrently finished stage is not re-run
+    stages[0] = workflow.Stage(['stage.py', 'b', '-o', 'b.txt'],
+                               inputs=['a.txt'], outputs=['b.txt'])
+    assert workflow.run(stages, cwd=str(cwd)) == ['stage.py b -o b.txt']